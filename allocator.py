@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from db import SQLiteDatabase, transaction
+
+
+class ColumnAllocator(SQLiteDatabase):
+    """
+        Hands out the sheet column of every report exactly once, also across processes.
+
+        Allocation for a (worksheet, department) pair is serialized in the process by an
+        asyncio lock and across processes by an IMMEDIATE transaction on a shared SQLite
+        file. A report gets the later of the next empty column seen in the sheet and the
+        column after the last one reserved, so reports that are reserved but not written
+        yet never share a column and can be written in parallel. Reservations are keyed by
+        the outbox entry id: allocating again for the same report returns its column.
+
+        Args:
+            path (str): Path to the SQLite file, shared by every process writing to the sheet.
+            retention (float): Seconds a released reservation is kept, longer than any cursor's max age.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS reservations (
+            worksheet TEXT NOT NULL,
+            department TEXT NOT NULL,
+            column_index INTEGER NOT NULL,
+            entry_id TEXT NOT NULL UNIQUE,
+            reserved_at REAL NOT NULL,
+            released_at REAL,
+            PRIMARY KEY (worksheet, department, column_index)
+        );
+    """
+
+    def __init__(self, path, retention=24 * 60 * 60):
+        super().__init__(path)
+        self.retention = retention
+        self._locks = {}
+
+    async def allocate(self, sheet, department, entry_id, next_column):
+        """
+            Reserves the column of a report.
+
+            Args:
+                sheet (gspread.models.Sheet): The worksheet the report goes to.
+                department (str): The department of the report.
+                entry_id (str): The outbox entry id of the report.
+                next_column (callable): Coroutine function returning the next empty column
+                    of the department in the sheet, called while the lock is held.
+
+            Returns:
+                int: The reserved column.
+        """
+        lock = self._locks.setdefault((sheet.title, department), asyncio.Lock())
+        async with lock:
+            return await self.run(self._reserve, sheet.title, department, entry_id, await next_column())
+
+    @staticmethod
+    def _reserve(conn, worksheet, department, entry_id, sheet_column):
+        with transaction(conn, "IMMEDIATE"):
+            row = conn.execute("SELECT column_index FROM reservations WHERE entry_id = ?", (entry_id,)).fetchone()
+            if row is not None:
+                return row[0]
+            last_column = conn.execute(
+                "SELECT MAX(column_index) FROM reservations WHERE worksheet = ? AND department = ?",
+                (worksheet, department)
+            ).fetchone()[0]
+            column_index = max(sheet_column, (last_column or 0) + 1)
+            conn.execute(
+                "INSERT INTO reservations (worksheet, department, column_index, entry_id, reserved_at) VALUES (?, ?, ?, ?, ?)",
+                (worksheet, department, column_index, entry_id, time.time())
+            )
+            return column_index
+
+    async def claim(self, sheet, department, entry_id, column_index):
+        # Record a column chosen before the allocator existed (or elsewhere), so it is not handed out again
+        await self.run(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO reservations (worksheet, department, column_index, entry_id, reserved_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (sheet.title, department, column_index, entry_id, time.time())
+        ))
+
+    async def release(self, entry_id):
+        # The report is written, its column is in the sheet now
+        await self.run(lambda conn: conn.execute(
+            "UPDATE reservations SET released_at = ? WHERE entry_id = ?", (time.time(), entry_id)
+        ))
+
+    async def purge(self):
+        # Forget released reservations once every process has re-read the sheet since
+        return await self.run(lambda conn: conn.execute(
+            "DELETE FROM reservations WHERE released_at < ?", (time.time() - self.retention,)
+        ).rowcount)
@@ -0,0 +1,158 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import gspread
+import requests
+from gspread import utils
+
+
+def quota_error(retry_after=None):
+    # The APIError gspread raises when Google answers 429 RESOURCE_EXHAUSTED
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps({"error": {
+        "code": 429, "message": "Quota exceeded for quota metric 'Write requests'", "status": "RESOURCE_EXHAUSTED"
+    }}).encode()
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return gspread.exceptions.APIError(response)
+
+
+def grid_error(range_name):
+    # The APIError Google answers a write past the last column of the worksheet with
+    response = requests.Response()
+    response.status_code = 400
+    response._content = json.dumps({"error": {
+        "code": 400, "message": f"Range ({range_name}) exceeds grid limits.", "status": "INVALID_ARGUMENT"
+    }}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet, spreadsheet_id="bench"):
+        self.id = spreadsheet_id
+        self.worksheet = worksheet
+
+    def values_batch_update(self, body):
+        return self.worksheet.values_batch_update(body)
+
+
+class FakeWorksheet:
+    """
+        In-memory stand-in for a gspread worksheet with the calls the bot makes.
+
+        Every call sleeps for `latency` seconds (plus up to `jitter`) on the calling thread,
+        like a real HTTP request on the writer's pool, and fails with a 429 quota error
+        with probability `error_rate`.
+
+        Args:
+            latency (float): Seconds every call takes.
+            jitter (float): Extra random seconds added to each call.
+            error_rate (float): Share of calls failing with a 429 error.
+            retry_after (float): Retry-After header sent with the 429 errors, None to omit it.
+            title (str): Title of the worksheet.
+            col_count (int): Columns in the grid, writes past them fail like on Google.
+    """
+
+    def __init__(self, latency=0.1, jitter=0.05, error_rate=0.0, retry_after=None, title="Sheet1", col_count=26):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.title = title
+        self.col_count = col_count
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.cells = {}
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors[operation] += 1
+            raise quota_error(self.retry_after)
+
+    def _row(self, row):
+        columns = [col for (cell_row, col) in self.cells if cell_row == row]
+        return [self.cells.get((row, col), "") for col in range(1, max(columns, default=0) + 1)]
+
+    def row_values(self, row):
+        self._request("row_values")
+        with self._lock:
+            return self._row(row)
+
+    def batch_get(self, ranges):
+        self._request("batch_get")
+        result = []
+        with self._lock:
+            for name in ranges:
+                grid = utils.a1_range_to_grid_range(name)
+                rows = [self._row(row) for row in range(grid["startRowIndex"] + 1, grid["endRowIndex"] + 1)]
+                if "startColumnIndex" in grid:
+                    rows = [row[grid["startColumnIndex"]:grid["endColumnIndex"]] for row in rows]
+                while rows and not rows[-1]:
+                    rows.pop()
+                result.append(rows)
+        return result
+
+    def values_batch_update(self, body):
+        self._request("values_batch_update")
+        with self._lock:
+            for update in body["data"]:
+                grid = utils.a1_range_to_grid_range(update["range"].split("!")[-1])
+                if grid["endColumnIndex"] > self.col_count:
+                    raise grid_error(update["range"])
+            for update in body["data"]:
+                grid = utils.a1_range_to_grid_range(update["range"].split("!")[-1])
+                for row_offset, row in enumerate(update["values"]):
+                    for col_offset, value in enumerate(row):
+                        cell = (grid["startRowIndex"] + 1 + row_offset, grid["startColumnIndex"] + 1 + col_offset)
+                        self.cells[cell] = "" if value is None else str(value)
+        return {"totalUpdatedCells": sum(len(row) for update in body["data"] for row in update["values"])}
+
+    def add_cols(self, cols):
+        self._request("add_cols")
+        with self._lock:
+            self.col_count += cols
+
+    def add_labels(self, departments):
+        # Write the row labels of every department block into column A, like the real template
+        with self._lock:
+            for department in departments.values():
+                self.cells[(department.start_row, 1)] = department.name
+                for question in department.questions:
+                    self.cells[(department.start_row + question.row, 1)] = question.prompt
+
+    def filled_columns(self, row):
+        # Number of report columns (from column C) with a value in the row
+        with self._lock:
+            return sum(1 for value in self._row(row)[2:] if value)
+
+
+class FakeCredentials:
+    # Credentials that never need a refresh during a run
+    expiry = datetime.utcnow() + timedelta(days=1)
+
+    def refresh(self, request):
+        pass
+
+
+def install(sheet_client, worksheet):
+    """
+        Points a SheetClient at the fake worksheet, no credentials file or network needed.
+
+        Args:
+            sheet_client (sheets.SheetClient): The client used by the bot.
+            worksheet (FakeWorksheet): The worksheet to serve.
+    """
+    sheet_client.creds = FakeCredentials()
+    sheet_client.client = worksheet
+    sheet_client._worksheet = worksheet
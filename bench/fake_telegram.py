@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """
+        Local stand-in for the Telegram Bot API.
+
+        Simulated users push updates with `send_text` and `press_button`, the bot receives
+        them through `getUpdates` long polling and its replies are collected per chat, so a
+        user can wait for the bot's answer with `wait_for`.
+
+        Args:
+            latency (float): Seconds every Bot API call takes.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.runner = None
+        self.url = None
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._replies = defaultdict(list)
+        self._waiters = defaultdict(list)
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        if offset < 0:
+            self._updates.clear()
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or 100)]
+
+    def _message(self, params):
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        self._replies[chat_id].append(text)
+        for waiter in list(self._waiters[chat_id]):
+            expected, future = waiter
+            if expected in text and not future.done():
+                future.set_result(text)
+                self._waiters[chat_id].remove(waiter)
+        return {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": text
+        }
+
+    def _push(self, update):
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+    def send_text(self, user_id, text):
+        message = {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id), "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self._push({"message": message})
+
+    def press_button(self, user_id, data):
+        self._push({"callback_query": {
+            "id": str(next(self._message_ids)), "chat_instance": str(user_id), "from": self._user(user_id),
+            "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "text": "-"}
+        }})
+
+    async def wait_for(self, user_id, expected, timeout=60):
+        """
+            Waits for the next bot message to the user's chat that contains `expected`.
+
+            Returns:
+                str: The text of the message.
+
+            Raises:
+                asyncio.TimeoutError: If no such message arrives in time.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[user_id].append((expected, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if (expected, future) in self._waiters[user_id]:
+                self._waiters[user_id].remove((expected, future))
+
+    def replies(self, user_id):
+        return list(self._replies[user_id])
+
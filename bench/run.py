@@ -0,0 +1,173 @@
+"""
+    Offline load test of the whole report flow.
+
+    Starts a fake Telegram Bot API server and points the bot at an in-memory worksheet,
+    then lets simulated users report for all five departments through long polling and
+    waits until the outbox has written every report to the sheet.
+
+    Usage (from the repository root):
+        python -m bench.run --users 2000 --concurrency 200 --sheets-latency 0.2 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from bench.fake_sheets import FakeWorksheet, install
+from bench.fake_telegram import FakeTelegramServer
+
+REPORT_SENT = "Your report has been successfully sent!"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the report bot against fake Telegram and Sheets backends.")
+    parser.add_argument("--users", type=int, default=1000, help="number of simulated users, one report each")
+    parser.add_argument("--concurrency", type=int, default=100, help="users in the middle of a report at once")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a user waits before each answer")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds every Bot API call takes")
+    parser.add_argument("--telegram-rate", type=float, default=1000, help="outbound limiter calls per second")
+    parser.add_argument("--chat-rate", type=float, default=100, help="outbound limiter calls per second to one chat")
+    parser.add_argument("--sheets-latency", type=float, default=0.1, help="seconds every Sheets call takes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of Sheets calls failing with 429")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After header sent with the 429 errors")
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "memory"), help="FSM storage to use")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="seconds to wait for the outbox to empty")
+    parser.add_argument("-v", "--verbose", action="store_true", help="keep the bot's INFO logs")
+    return parser.parse_args(argv)
+
+
+def percentile(values, share):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+# The answer a user gives to a question, valid for its validator
+def answer(question):
+    return {"parse_int": "5", "parse_float": "1.5"}.get(question.parse.__name__, "-")
+
+
+async def report(server, user_id, department, think_time):
+    """
+        Walks one user through the whole report flow.
+
+        Returns:
+            float: Seconds from /start to the bot confirming the report.
+    """
+    async def step(send, expected):
+        if think_time:
+            await asyncio.sleep(think_time)
+        send()
+        await server.wait_for(user_id, expected)
+
+    started = time.perf_counter()
+    await step(lambda: server.send_text(user_id, "/start"), "choose the department")
+    await step(lambda: server.press_button(user_id, department.key), "You have chosen")
+    await step(lambda: server.press_button(user_id, "confirm"), "Enter the password")
+
+    expected = [question.prompt for question in department.questions[1:]] + [REPORT_SENT]
+    await step(lambda: server.send_text(user_id, department.password), department.questions[0].prompt)
+    for question, reply in zip(department.questions, expected):
+        await step(lambda: server.send_text(user_id, answer(question)), reply)
+    return time.perf_counter() - started
+
+
+async def wait_for_outbox(outbox, timeout):
+    deadline = time.monotonic() + timeout
+    while await outbox.count_pending():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+async def main(args):
+    server = FakeTelegramServer(latency=args.telegram_latency)
+    url = await server.start()
+
+    # The bot reads its configuration in create_app, point everything at the fakes and a scratch directory
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update({
+        "TOKEN": "123456:bench",
+        "TELEGRAM_API_URL": url,
+        "TELEGRAM_GLOBAL_RATE": str(args.telegram_rate),
+        "TELEGRAM_CHAT_RATE": str(args.chat_rate),
+        "FSM_STORAGE": f"sqlite:///{workdir}/fsm.sqlite3" if args.storage == "sqlite" else "memory://",
+        "OUTBOX_PATH": f"{workdir}/outbox.sqlite3",
+        "LEDGER_PATH": f"{workdir}/ledger.sqlite3",
+        "REMINDERS_PATH": f"{workdir}/reminders.sqlite3",
+        "REPORTS_PATH": f"{workdir}/reports.sqlite3",
+        "ALLOCATOR_PATH": f"{workdir}/columns.sqlite3",
+        "METRICS_PORT": "0",
+    })
+    import main as bot_main
+    from sheets import SheetClient
+
+    worksheet = FakeWorksheet(latency=args.sheets_latency, error_rate=args.error_rate, retry_after=args.retry_after)
+    worksheet.add_labels(bot_main.DEPARTMENTS)
+    sheet_client = SheetClient(None, bot_main.scope)
+    install(sheet_client, worksheet)
+
+    bot_main.create_app(sheet_client_override=sheet_client)
+    await bot_main.on_startup(bot_main.dp)
+    polling = asyncio.create_task(bot_main.dp.start_polling(timeout=1, relax=0))
+
+    departments = itertools.cycle(bot_main.DEPARTMENTS.values())
+    assignments = [(100000 + index, next(departments)) for index in range(args.users)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async def user(user_id, department):
+        nonlocal failures
+        async with semaphore:
+            try:
+                latencies.append(await report(server, user_id, department, args.think_time))
+            except asyncio.TimeoutError:
+                failures += 1
+                replies = server.replies(user_id)
+                logging.warning(f"User {user_id} ({department.key}) got stuck after: {replies[-1] if replies else None!r}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id, department) for user_id, department in assignments))
+    confirmed = time.perf_counter() - started
+    drained = await wait_for_outbox(bot_main.outbox, args.drain_timeout)
+    elapsed = time.perf_counter() - started
+
+    bot_main.dp.stop_polling()
+    await polling
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await server.close()
+
+    reports = len(latencies)
+    written = sum(worksheet.filled_columns(department.start_row) for department in bot_main.DEPARTMENTS.values())
+    sheet_calls = sum(worksheet.calls.values())
+    print(f"Users:                {args.users} ({failures} failed)")
+    print(f"Reports confirmed:    {reports} in {confirmed:.2f}s")
+    print(f"Reports in sheet:     {written}{'' if drained else ' (outbox not drained)'} after {elapsed:.2f}s")
+    print(f"Throughput:           {written / elapsed:.1f} reports/s")
+    print(f"Report latency:       p50 {percentile(latencies, 0.5) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, max {max(latencies, default=0) * 1000:.0f} ms")
+    print(f"Sheets calls:         {sheet_calls} ({sheet_calls / max(written, 1):.3f} per report), "
+          f"{sum(worksheet.errors.values())} failed with 429")
+    for operation, count in sorted(worksheet.calls.items()):
+        print(f"  {operation:<20}{count}")
+    print(f"Sheets retries:       {bot_main.sheets_retry.retries}")
+    print(f"Bot API calls:        {sum(server.calls.values()) - server.calls['getUpdates']} "
+          f"({server.calls['getUpdates']} getUpdates)")
+    return 0 if drained and not failures and written == reports else 1
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    logging.basicConfig(level=logging.INFO if arguments.verbose else logging.WARNING)
+    if not arguments.verbose:
+        # main.py configures INFO logging in create_app, keep the bot quiet unless asked
+        logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(arguments)))
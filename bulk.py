@@ -0,0 +1,204 @@
+import csv
+import io
+from datetime import datetime
+
+from departments import DEPARTMENTS
+
+# Largest accepted upload and number of reports in it
+MAX_FILE_SIZE = 1024 * 1024
+MAX_ROWS = 500
+
+# Dates are accepted as written in the sheet or in ISO format
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d.%m.%Y")
+
+
+class BulkReport:
+    """
+        Result of parsing a bulk submission: the valid reports and the problems found.
+
+        Attributes:
+            reports (list): Report dicts with `department`, `date` and every answer, ready for the outbox.
+            errors (list): Descriptions of the invalid fields and rows.
+    """
+
+    def __init__(self):
+        self.reports = []
+        self.errors = []
+
+
+# Turn a cell of an uploaded file into the text a user would have typed
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return str(value).strip()
+
+
+def parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(text)
+
+
+def parse_values(department, values, prefix=""):
+    """
+        Validates the answers of one report against the department's questions in one pass.
+
+        Args:
+            department (departments.Department): The department of the report.
+            values (dict): Answer text by field.
+            prefix (str): Prepended to every error, e.g. the row of an uploaded file.
+
+        Returns:
+            tuple: The parsed answers by field and the list of errors.
+    """
+    parsed = {}
+    errors = []
+    for question in department.questions:
+        text = values.get(question.field, "")
+        if not text:
+            errors.append(f"{prefix}{question.field}: missing")
+            continue
+        try:
+            parsed[question.field] = question.parse(text)
+        except ValueError:
+            errors.append(f"{prefix}{question.field}: {text!r} is not valid ({question.prompt.rstrip(':')})")
+    return parsed, errors
+
+
+def is_bulk_text(text):
+    # A whole report in one message has one answer per line
+    return len([line for line in text.splitlines() if line.strip()]) > 1
+
+
+def parse_message(department, text):
+    """
+        Parses a whole report sent as one message.
+
+        Either every line is `field=value` (in any order), or there is one line per question
+        in the order they are asked.
+
+        Args:
+            department (departments.Department): The department the user logged in to.
+            text (str): The message text.
+
+        Returns:
+            tuple: The parsed answers by field and the list of errors.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    fields = {question.field for question in department.questions}
+
+    if lines[0].partition("=")[0].strip().lower() in fields:
+        values = {}
+        errors = []
+        for line in lines:
+            field, separator, value = line.partition("=")
+            field = field.strip().lower()
+            if not separator or field not in fields:
+                errors.append(f"{line!r}: expected one of {', '.join(sorted(fields))} followed by '='")
+            elif field in values:
+                errors.append(f"{field}: given more than once")
+            else:
+                values[field] = value.strip()
+        parsed, value_errors = parse_values(department, values)
+        return parsed, errors + value_errors
+
+    if len(lines) != len(department.questions):
+        return {}, [f"Expected {len(department.questions)} lines, one per question, or field=value lines, "
+                    f"got {len(lines)} lines"]
+    return parse_values(department, dict(zip((question.field for question in department.questions), lines)))
+
+
+def read_rows(content, file_name):
+    """
+        Reads the rows of an uploaded CSV or XLSX file as dicts keyed by the lower-cased header.
+
+        Yields:
+            tuple: The row number in the file and the row, empty rows are skipped.
+
+        Raises:
+            ValueError: If the file type is not supported.
+            ImportError: If an XLSX file is sent and openpyxl is not installed.
+    """
+    if file_name.lower().endswith(".csv"):
+        text = content.decode("utf-8-sig")
+        try:
+            dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = csv.reader(io.StringIO(text), dialect)
+    elif file_name.lower().endswith(".xlsx"):
+        # openpyxl is only needed for Excel uploads
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        raise ValueError(file_name)
+
+    header = None
+    for number, row in enumerate(rows, start=1):
+        cells = [_text(value) for value in row]
+        if header is None:
+            header = [cell.lower() for cell in cells]
+        elif any(cells):
+            yield number, dict(zip(header, cells))
+
+
+def parse_rows(rows, today, department=None):
+    """
+        Validates the rows of an uploaded file, one report per row.
+
+        Every row names its `department` and `password` unless the user is already logged in
+        to a department; `date` defaults to today. Rows with errors are skipped and reported,
+        the other rows are returned as reports.
+
+        Args:
+            rows (iterable): Rows as returned by `read_rows`.
+            today (datetime.date): The current day, later dates are rejected.
+            department (str): The department the user is logged in to, if any.
+
+        Returns:
+            BulkReport: The valid reports and the errors.
+    """
+    result = BulkReport()
+    seen = set()
+    for count, (number, row) in enumerate(rows, start=1):
+        prefix = f"Row {number}: "
+        if count > MAX_ROWS:
+            result.errors.append(f"Only the first {MAX_ROWS} reports of a file are read")
+            break
+
+        key = row["department"].lower() if row.get("department") else department
+        if key not in DEPARTMENTS:
+            result.errors.append(f"{prefix}unknown department {key!r}")
+            continue
+        if key != department and row.get("password") != DEPARTMENTS[key].password:
+            result.errors.append(f"{prefix}wrong password for {key}")
+            continue
+
+        try:
+            day = parse_date(row["date"]) if row.get("date") else today
+        except ValueError:
+            result.errors.append(f"{prefix}date {row['date']!r} is not dd/mm/yyyy")
+            continue
+        if day > today:
+            result.errors.append(f"{prefix}{day.strftime('%d/%m/%Y')} is in the future")
+            continue
+        if (key, day) in seen:
+            result.errors.append(f"{prefix}a second {key} report for {day.strftime('%d/%m/%Y')}")
+            continue
+
+        parsed, errors = parse_values(DEPARTMENTS[key], row, prefix)
+        if errors:
+            result.errors.extend(errors)
+            continue
+        seen.add((key, day))
+        result.reports.append(dict(parsed, department=key, date=day.isoformat()))
+    return result
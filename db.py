@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+@contextmanager
+def transaction(conn, mode=""):
+    # Run the statements of the block in one transaction, the connections are in autocommit mode otherwise
+    # (mode "IMMEDIATE" takes the write lock up front, so other processes wait instead of reading stale rows)
+    conn.execute(f"BEGIN {mode}")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SQLiteDatabase:
+    """
+        Base class for the bot's local SQLite files.
+
+        The database runs in WAL mode with `synchronous=FULL`, so every committed
+        transaction is fsync'd, and all statements run on one dedicated thread so the
+        event loop never waits on disk I/O. Subclasses put their tables in `schema`
+        and run their queries with `run`.
+
+        Args:
+            path (str): Path to the SQLite file.
+    """
+
+    schema = ""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+
+    def connect(self):
+        # Open the connection on first use and make sure the tables exist
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(self.schema)
+            self._conn = conn
+        return self._conn
+
+    async def run(self, func, *args):
+        """
+            Calls `func(connection, *args)` on the database thread.
+
+            Returns:
+                The return value of `func`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, func, *args))
+
+    def _call(self, func, *args):
+        return func(self.connect(), *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,133 @@
+import math
+from types import MappingProxyType
+from typing import Callable, NamedTuple, Tuple
+
+INT_ERROR = "Please enter a numeric value only. Try again:"
+FLOAT_ERROR = "Please enter a valid numeric value. Try again:"
+TEXT_ERROR = "Please send a text message of at most 1000 characters. Try again:"
+
+# Longest free-text answer, together with the fixed fields it bounds the size of a report session
+MAX_TEXT_LENGTH = 1000
+
+
+# Validators turn the user's answer into the stored value and raise ValueError on invalid input
+def parse_int(text):
+    if not text.isdigit():
+        raise ValueError(text)
+    return int(text)
+
+
+def parse_float(text):
+    # nan and inf are not valid JSON for the session storage and the Sheets API
+    value = float(text.replace(',', '.'))
+    if not math.isfinite(value):
+        raise ValueError(text)
+    return value
+
+
+def parse_text(text):
+    if not text or len(text) > MAX_TEXT_LENGTH:
+        raise ValueError(text)
+    return text
+
+
+class Question(NamedTuple):
+    """
+        One step of a department's report.
+
+        Attributes:
+            field (str): Key the answer is stored under.
+            prompt (str): Message that asks the question.
+            parse (callable): Validator returning the stored value, raises ValueError on invalid input.
+            error (str): Message sent when the answer is invalid.
+            row (int): Row of the answer relative to the department's start row.
+            shift (int): Column of the answer relative to the report's date column.
+    """
+    field: str
+    prompt: str
+    parse: Callable
+    error: str
+    row: int
+    shift: int = 0
+
+
+class Department(NamedTuple):
+    key: str
+    name: str
+    password: str
+    start_row: int
+    questions: Tuple[Question, ...]
+
+
+def _int(field, prompt, row, shift=0):
+    return Question(field, prompt, parse_int, INT_ERROR, row, shift)
+
+
+def _float(field, prompt, row):
+    return Question(field, prompt, parse_float, FLOAT_ERROR, row)
+
+
+def _text(field, prompt, row):
+    return Question(field, prompt, parse_text, TEXT_ERROR, row)
+
+
+# Questions shared by the two service departments, plan values go one column to the right of the date
+_SERVICE_QUESTIONS = (
+    _int('plan', "Planned arrival at work", 1, shift=1),
+    _int('serviced', "Readiness plan (departure)", 2, shift=1),
+    _int('ready_tech', "Quantity of ready equipment", 3),
+    _int('closed_orders', "Number of closed orders", 5),
+    _int('own', "Number of own vehicles:", 4),
+    _int('new_clients', "Number of new clients:", 6),
+    _int('workers', "Number of employees:", 7),
+    _float('worked_hours', "Number of worked hours:", 8),
+    _float('employee_performance', "Employee performance:", 9),
+    _text('problems', "Problems detected today (if none, send ‘-’):", 10),
+    _text('plans', "Plans for solving (if none, send ‘-’):", 11),
+    _text('notes', "Add notes (if none, send ‘-’):", 12)
+)
+
+# Departments in the order they appear in the sheet, questions in the order they are asked
+DEPARTMENTS = MappingProxyType({department.key: department for department in (
+    Department("rem1", "service1", "1", 4, _SERVICE_QUESTIONS),
+    Department("rem2", "service2", "2", 18, _SERVICE_QUESTIONS),
+    Department("wash", "wash", "3", 32, (
+        _int('serviced', "Number of washes from 17:00 to 08:00", 1),
+        _int('serviced1', "Actual number of washes from 08:00 to 17:00", 2),
+        _int('own', "Number of own vehicles:", 3),
+        _int('new_clients', "Number of new clients:", 4),
+        _float('worked_hours', "Number of worked hours", 5),
+        _float('employee_performance', "Employee performance:", 6),
+        _text('problems', "Problems detected today (if none, send ‘-’):", 7),
+        _text('plans', "Plans for solving (if none, send ‘-’):", 8),
+        _text('notes', "Add notes (if none, send ‘-’):", 9)
+    )),
+    Department("to", "ТО", "4", 43, (
+        _int('plan', "Planned TO records", 1, shift=1),
+        _int('serviced', "Actual amount TO", 2),
+        _int('own', "Quantity of own vehicles", 3),
+        _int('new_clients', "Number of new clients:", 4),
+        _int('workers', "Number of employees:", 5),
+        _float('worked_hours', "Number of worked hours:", 6),
+        _float('employee_performance', "Employee performance:", 7),
+        _text('problems', "Problems detected today (if none, send ‘-’):", 8),
+        _text('plans', "Plans for solving (if none, send ‘-’):", 9),
+        _text('notes', "Add notes (if none, send ‘-’):", 10)
+    )),
+    Department("breakup", "breakup", "5", 55, (
+        _int('plan', "Planned breakup records", 1, shift=1),
+        _int('serviced', "Actual amount breakup", 2),
+        _float('load_percentage', "Load percentage", 3),
+        _int('new_clients', "Number of new clients", 4),
+        _text('notes', "Add notes (if none, send ‘-’):", 5)
+    ))
+)})
+
+# Define starting rows for different departments
+DEPARTMENT_START_ROWS = MappingProxyType({key: department.start_row for key, department in DEPARTMENTS.items()})
+
+
+# Every answer field of any department, in a fixed order
+REPORT_FIELDS = tuple(dict.fromkeys(
+    question.field for department in DEPARTMENTS.values() for question in department.questions
+))
@@ -0,0 +1,37 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+        Returns a module whose code only runs on first attribute access.
+
+        Used for heavy dependencies (gspread, google-auth, requests, apscheduler) so that
+        importing the bot stays cheap and they are loaded when first needed. A module that
+        is already imported is returned as is.
+
+        Args:
+            name (str): Full name of the module.
+
+        Returns:
+            module: The (possibly not yet executed) module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def preload(*modules):
+    # Run the code of lazily imported modules (or import modules by name) now, e.g. on a worker thread
+    for module in modules:
+        if isinstance(module, str):
+            importlib.import_module(module)
+        else:
+            getattr(module, "__dict__")
@@ -0,0 +1,71 @@
+import logging
+import time
+
+from db import SQLiteDatabase, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class Lease(SQLiteDatabase):
+    """
+        Time-limited leadership shared by the worker processes through a SQLite file.
+
+        At most one holder owns a lease at a time. The holder renews it well within `ttl`
+        seconds; if it stops renewing (crash, hang) the lease expires and the next worker
+        that asks takes it over. Acquiring and renewing run in an IMMEDIATE transaction, so
+        two processes can never both see the lease as free.
+
+        Args:
+            path (str): Path to the SQLite file, shared by all workers.
+            name (str): Name of the lease, e.g. "scheduler".
+            holder (str): Unique name of this worker.
+            ttl (float): Seconds a lease stays valid without renewal.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path, name, holder, ttl=30):
+        super().__init__(path)
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.held = False
+
+    async def acquire(self):
+        """
+            Takes the lease if it is free or expired, or renews it if this worker holds it.
+
+            Returns:
+                bool: True if this worker holds the lease for the next `ttl` seconds.
+        """
+        held = await self.run(self._acquire, self.name, self.holder, self.ttl)
+        if held != self.held:
+            logger.info(f"{self.holder} {'acquired' if held else 'lost'} the {self.name} lease")
+        self.held = held
+        return held
+
+    @staticmethod
+    def _acquire(conn, name, holder, ttl):
+        now = time.time()
+        with transaction(conn, "IMMEDIATE"):
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row["holder"] != holder and row["expires_at"] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)", (name, holder, now + ttl)
+            )
+            return True
+
+    async def release(self):
+        # Give the lease up at shutdown so another worker takes over without waiting for it to expire
+        if self.held:
+            await self.run(lambda conn: conn.execute(
+                "DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder)
+            ))
+            self.held = False
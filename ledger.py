@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from db import SQLiteDatabase
+
+
+class SubmissionLedger(SQLiteDatabase):
+    """
+        Persistent record of which user reported for which department on which day.
+
+        Rows are keyed by (day, department) with an index on user_id. A report is recorded
+        only once its sheet write is committed; reports still waiting in the outbox are
+        tracked as pending in memory so they cannot be submitted twice. Today's submissions
+        are mirrored in memory, so `can_send` and `missing_departments` need no query.
+        The mirror is reset at day rollover and rows older than `retention_days` are
+        deleted.
+
+        Args:
+            path (str): Path to the SQLite file.
+            departments (iterable): All department keys.
+            retention_days (int): Number of days to keep.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS submissions (
+            day TEXT NOT NULL,
+            department TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            committed_at REAL NOT NULL,
+            PRIMARY KEY (day, department, user_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS submissions_user_id ON submissions (user_id, day);
+    """
+
+    def __init__(self, path, departments, retention_days=31):
+        super().__init__(path)
+        self.departments = tuple(departments)
+        self.retention_days = retention_days
+        self._day = None
+        self._committed = {}
+        self._pending = {}
+
+    def _roll_over(self, day):
+        # Start a new day with empty mirrors
+        if day != self._day:
+            self._day = day
+            self._committed = {department: set() for department in self.departments}
+            self._pending = {department: set() for department in self.departments}
+
+    async def load(self, day):
+        """
+            Fills today's mirror from the database and trims old days.
+
+            Args:
+                day (datetime.date): The current day.
+        """
+        rows = await self.run(self._load, day.isoformat(), (day - timedelta(days=self.retention_days)).isoformat())
+        self._roll_over(day)
+        self._committed = {department: set() for department in self.departments}
+        for department, user_id in rows:
+            self._committed.setdefault(department, set()).add(user_id)
+
+    @staticmethod
+    def _load(conn, day, oldest_day):
+        conn.execute("DELETE FROM submissions WHERE day < ?", (oldest_day,))
+        return conn.execute("SELECT department, user_id FROM submissions WHERE day = ?", (day,)).fetchall()
+
+    def can_send(self, user_id, department, day):
+        # Check if the user has not reported (or queued a report) for the department on that day
+        self._roll_over(day)
+        return user_id not in self._committed.get(department, ()) and user_id not in self._pending.get(department, ())
+
+    def mark_pending(self, user_id, department, day):
+        # A finished report waiting in the outbox
+        if day == self._day or self._day is None:
+            self._roll_over(day)
+            self._pending.setdefault(department, set()).add(user_id)
+
+    async def record(self, user_id, department, day):
+        """
+            Records a report whose sheet write is committed.
+
+            Args:
+                user_id (int): The user who sent the report.
+                department (str): The department of the report.
+                day (datetime.date): The day the report was submitted.
+        """
+        if self._day is not None and day > self._day:
+            await self.load(day)
+
+        await self.run(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO submissions (day, department, user_id, committed_at) VALUES (?, ?, ?, ?)",
+            (day.isoformat(), department, user_id, time.time())
+        ))
+
+        if day == self._day:
+            self._pending.get(department, set()).discard(user_id)
+            self._committed.setdefault(department, set()).add(user_id)
+
+    def missing_departments(self, day):
+        # Departments nobody has reported for yet on that day
+        self._roll_over(day)
+        return [department for department in self.departments if not self._committed[department]]
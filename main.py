@@ -1,141 +1,411 @@
+import time
+
+# Process start as seen by the bot, used for the startup time budget
+STARTED_AT = time.perf_counter()
+
+import io
 import os
+import socket
+import sqlite3
 from dotenv import load_dotenv
 import logging
-import gspread
-import requests
-import time
 from concurrent.futures import ThreadPoolExecutor
 from aiogram.dispatcher.filters import CommandStart
-from aiogram import Bot, Dispatcher, types
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from aiogram import Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from aiogram.utils import executor
-from datetime import datetime
+from aiogram.utils.exceptions import BotBlocked, ChatNotFound, TelegramAPIError, UserDeactivated
+from datetime import date, datetime
 import pytz
 import asyncio
-from gspread import utils
-from apscheduler.triggers.cron import CronTrigger
-from google.auth.transport.requests import Request
-from google.oauth2.service_account import Credentials
 
+import bulk
 import keyboard as kb
+from lazy import lazy_import, preload
+from lease import Lease
+from ledger import SubmissionLedger
+from metrics import MetricsMiddleware, Registry, start_metrics_server
+from outbox import Outbox
+from reminders import ReminderRegistry
+from reports import ReportStore, format_status, format_summary
+from sender import PRIORITY_NAMES, OutboundLimiter, ThrottledBot, bulk_priority
+from storage import create_storage
+from validation import ValidationMiddleware
+from departments import DEPARTMENT_START_ROWS, DEPARTMENTS, REPORT_FIELDS
+from allocator import ColumnAllocator
+
+# Google Sheets and its dependencies are loaded off the event loop once the bot is up
+gspread = lazy_import("gspread")
+requests = lazy_import("requests")
+retry = lazy_import("retry")
+sheets = lazy_import("sheets")
 
-# Load environment variables from the .env file
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Google Sheets Authorization
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-# Load the Google Sheets credentials file from environment
-creds_file = os.getenv("CREDS")
-creds = Credentials.from_service_account_file(creds_file, scopes=scope)
-
-# Function to refresh credentials if needed
-def ensure_credentials_refresh(creds):
-    if not creds.valid or creds.expired:
-        creds.refresh(Request())
-    return creds
-
-# Refresh credentials and authorize gspread
-def get_refreshed_sheet():
-    global creds
-    creds = ensure_credentials_refresh(creds)
-    client = gspread.authorize(creds)
-    sheet = client.open("Report").sheet1 #OPEN THE SPREADSHEET BY ITS NAME(IN MY CASE - "Report")
-    sheet.client.session.timeout = 60  # Set the session timeout
-    return sheet
-
-# Initialize bot and dispatcher
-API_TOKEN = os.getenv("TOKEN")  # Load the Telegram bot token from environmentgit
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
-dp.middleware.setup(LoggingMiddleware())
-
-# Create a scheduler for task scheduling
-scheduler = AsyncIOScheduler()
-scheduler.start()
-
-# Executor for handling concurrent sheet updates
-executor_pool = ThreadPoolExecutor(max_workers=5)
+
+# Components built by create_app() and start_services(), importing this module has no side effects
+bot = None
+dp = None
+storage = None
+scheduler = None
+metrics_registry = None
+validation = None
+sheet_client = None
+sheet_writer = None
+write_buffer = None
+sheets_retry = None
+column_cursors = None
+report_status = None
+column_allocator = None
+sheet_layout = None
+outbox = None
+ledger = None
+reminders = None
+report_store = None
+# Leader lease shared by every process of the bot, only its holder writes to the sheet and sends reminders
+leader_lease = None
+# Event used to wake the outbox drainer as soon as a report is recorded
+outbox_ready = asyncio.Event()
+# Lock that lets concurrent /status misses share one sheet read
+status_refresh = asyncio.Lock()
+# Task importing the heavy modules and building the Sheets pipeline, shared by every caller of load_sheets
+sheets_loading = None
+# Long-running tasks started in on_startup and cancelled in on_shutdown
+background_tasks = []
+# Tasks that write to the sheet and run the scheduler, only run by the leader
+leader_tasks = []
+
+# Seconds before a failed outbox entry is replayed again
+OUTBOX_RETRY_DELAY = 60
+# Local /metrics endpoint, 0 disables it
+METRICS_PORT = 9100
+# Seconds the bot may take from process start to receiving updates before a warning is logged
+STARTUP_BUDGET = 2.0
+
+# Get the cached report worksheet for a day's shard (authorizes and creates the shard on first use)
+def get_refreshed_sheet(day=None):
+    return sheet_client.worksheet(day)
+
+def create_app(sheet_client_override=None, worker_name=None):
+    """
+        Builds the bot, its storage and dispatcher and registers the handlers.
+
+        Nothing here touches the network or Google Sheets: the Sheets client, the write
+        pipeline and the scheduler are built by `start_services` after startup.
+
+        Args:
+            sheet_client_override (sheets.SheetClient): Client to use instead of the one configured by
+                the environment, e.g. one serving a fake worksheet.
+            worker_name (str): Unique name of this process among the ones sharing the lease file, the
+                host name and process id by default. The processes compete for the leader lease, so only
+                one of them writes to the sheet and sends reminders.
+
+        Returns:
+            Dispatcher: The dispatcher, ready to be started with polling or a webhook.
+    """
+    global bot, dp, storage, metrics_registry, sheet_client, outbox, ledger, reminders, report_store, column_allocator
+    global leader_lease, validation
+    global OUTBOX_RETRY_DELAY, METRICS_PORT, STARTUP_BUDGET
+
+    # Load environment variables from the .env file
+    load_dotenv()
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    sheet_client = sheet_client_override
+
+    # Initialize bot and dispatcher
+    API_TOKEN = os.getenv("TOKEN")  # Load the Telegram bot token from environmentgit
+    # Every API call goes through the outbound limiter: global and per-chat token buckets, interactive replies first
+    bot = ThrottledBot(
+        token=API_TOKEN,
+        server=TelegramAPIServer.from_base(os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")),  # Local Bot API server or a test double
+        limiter=OutboundLimiter(
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", 30)),  # Calls per second for the whole bot
+            chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", 1))  # Calls per second to one chat
+        )
+    )
+    # FSM storage: sqlite:///path (default), redis://host:port/db or memory://
+    storage = create_storage(
+        os.getenv("FSM_STORAGE", "sqlite:///fsm.sqlite3"),
+        ttl=int(os.getenv("FSM_SESSION_TTL", 24 * 60 * 60)),  # Abandoned sessions expire after a day
+        fields=("department", "step") + REPORT_FIELDS  # Session keys memory:// keeps at fixed positions
+    )
+    dp = Dispatcher(bot, storage=storage)
+    dp.middleware.setup(LoggingMiddleware())
+
+    # Metrics served on a local /metrics endpoint in the Prometheus text format
+    metrics_registry = Registry()
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))  # 0 disables the endpoint
+    dp.middleware.setup(MetricsMiddleware(
+        metrics_registry.histogram("bot_handler_duration_seconds", "Time spent in message and callback handlers.",
+                                   labels=("handler", "state")),
+        profile_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),  # Share of updates run under cProfile
+        slow_threshold=float(os.getenv("SLOW_UPDATE_THRESHOLD", 1))  # Profiled updates slower than this are logged
+    ))
+
+    # Invalid button presses and answers are rejected before the handlers touch the storage
+    validation = ValidationMiddleware(
+        callbacks={
+            ReportForm.choosing_department.state: DEPARTMENTS,
+            ReportForm.confirming_department.state: ("confirm", "reselect")
+        },
+        text_states=(ReportForm.entering_password.state, ReportForm.answering.state),
+        departments=DEPARTMENTS,
+        answering_state=ReportForm.answering.state
+    )
+    dp.middleware.setup(validation)
+    STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 2))  # Seconds from process start to receiving updates
+
+    # Durable outbox of finished reports that are not written to the sheet yet
+    outbox = Outbox(os.getenv("OUTBOX_PATH", "outbox.sqlite3"))
+    OUTBOX_RETRY_DELAY = int(os.getenv("OUTBOX_RETRY_DELAY", 60))  # Seconds before a failed entry is replayed again
+
+    # Column reservations of the reports being written, shared by every process writing to the sheet
+    column_allocator = ColumnAllocator(os.getenv("ALLOCATOR_PATH", "columns.sqlite3"))
+
+    # Persistent record of the reports committed to the sheet, used to allow one report per department a day
+    ledger = SubmissionLedger(
+        os.getenv("LEDGER_PATH", "ledger.sqlite3"),
+        DEPARTMENTS,
+        retention_days=int(os.getenv("LEDGER_RETENTION_DAYS", 31))
+    )
+
+    # Reminder subscriptions, one per chat
+    reminders = ReminderRegistry(os.getenv("REMINDERS_PATH", "reminders.sqlite3"))
+
+    # Local copy of the numeric report fields, /summary is answered from it without touching Google Sheets
+    report_store = ReportStore(os.getenv("REPORTS_PATH", "reports.sqlite3"))
+
+    # Only the process holding this lease drains the outbox into the sheet and sends reminders,
+    # whether it is a supervisor worker or one of several webhook instances
+    leader_lease = Lease(
+        os.getenv("LEASE_PATH", "leases.sqlite3"),
+        "leader",
+        worker_name or f"{socket.gethostname()}-{os.getpid()}",
+        ttl=float(os.getenv("LEADER_LEASE_TTL", 30))  # Seconds before a silent leader is replaced
+    )
+
+    register_handlers(dp)
+    register_metrics(metrics_registry)
+    return dp
+
+def create_sheets_pipeline():
+    """
+        Builds the Google Sheets client, writer, write-behind buffer, column cursors, status cache and retry policy.
+
+        Called by `start_services` after the heavy modules have been loaded.
+    """
+    global sheet_client, sheet_writer, write_buffer, sheets_retry, column_cursors, sheet_layout, report_status
+
+    # Long-lived client and worksheet cache, credentials are loaded from the file given in CREDS
+    if sheet_client is None:
+        sheet_client = sheets.SheetClient(
+            os.getenv("CREDS"),
+            scope,
+            spreadsheet_key=os.getenv("SPREADSHEET_KEY"),  # Open the spreadsheet by key when set, otherwise by its name
+            spreadsheet_title="Report",  # OPEN THE SPREADSHEET BY ITS NAME(IN MY CASE - "Report")
+            timeout=60,
+            shard_title=os.getenv("SHEET_SHARD_TITLE", "Report %Y-%m"),  # One worksheet per month, empty for a single worksheet
+            template_title=os.getenv("SHEET_TEMPLATE", "Template")  # Worksheet new shards are copied from
+        )
+
+    # Executor for handling concurrent sheet updates
+    SHEETS_MAX_IN_FLIGHT = int(os.getenv("SHEETS_MAX_IN_FLIGHT", 5))  # Cap on Google requests running at once
+    sheet_writer = sheets.SheetWriter(
+        ThreadPoolExecutor(max_workers=SHEETS_MAX_IN_FLIGHT),
+        max_in_flight=SHEETS_MAX_IN_FLIGHT,
+        call_latency=metrics_registry.histogram("sheets_call_duration_seconds", "Google Sheets calls by operation.",
+                                                labels=("operation", "outcome"))
+    )
+
+    # One retry policy and circuit breaker for every Google Sheets call
+    sheets_retry = retry.RetryPolicy(
+        retry.CircuitBreaker(
+            "Google Sheets",
+            failure_threshold=int(os.getenv("SHEETS_BREAKER_THRESHOLD", 5)),  # Consecutive failures that open the breaker
+            reset_timeout=float(os.getenv("SHEETS_BREAKER_RESET", 30))  # Seconds before a probe request is allowed
+        ),
+        max_attempts=int(os.getenv("SHEETS_RETRY_ATTEMPTS", 5)),
+        base_delay=float(os.getenv("SHEETS_RETRY_BASE_DELAY", 1)),
+        max_delay=float(os.getenv("SHEETS_RETRY_MAX_DELAY", 60))
+    )
+
+    # Buffer that merges reports finished close together into one batched write
+    write_buffer = sheets.WriteBehindBuffer(
+        sheet_writer,
+        sheets_retry,
+        flush_interval=float(os.getenv("SHEETS_FLUSH_INTERVAL", 0.5)),
+        max_batch_size=int(os.getenv("SHEETS_MAX_BATCH", 50))
+    )
+
+    # Next empty column of every department, kept in memory between reports
+    column_cursors = sheets.ColumnCursorIndex(DEPARTMENT_START_ROWS, max_age=int(os.getenv("CURSOR_MAX_AGE", 900)))
+
+    # Today's reports per department, /status is answered from memory between committed writes
+    report_status = sheets.ReportStatusCache(
+        DEPARTMENT_START_ROWS,
+        max_age=float(os.getenv("STATUS_MAX_AGE", 300))  # Seconds before reports written by other processes show up
+    )
+
+    # Row labels of every department block, checked against the DEPARTMENTS table at startup
+    sheet_layout = sheets.SheetLayout(DEPARTMENTS)
+
+# Session sizes labelled for the fsm_session_bytes gauge
+async def collect_session_bytes():
+    return {(stat,): size for stat, size in (await storage.session_bytes()).items()}
+
+def register_metrics(registry):
+    # Values owned by other components, read when /metrics is scraped (Sheets values appear once it is started)
+    registry.counter("sheets_retries_total", "Google Sheets calls retried after a transient error.",
+                     function=lambda: sheets_retry.retries)
+    registry.counter("sheets_failures_total", "Google Sheets calls that failed after all retries.",
+                     function=lambda: sheets_retry.failures)
+    registry.gauge("sheets_circuit_open", "1 while the Google Sheets circuit breaker refuses calls.",
+                   function=lambda: int(sheets_retry.breaker.state != sheets_retry.breaker.CLOSED))
+    registry.gauge("sheets_in_flight", "Google Sheets calls running right now.",
+                   function=lambda: sheet_writer.in_flight)
+    registry.gauge("sheets_write_buffer_reports", "Reports waiting in the write-behind buffer.",
+                   function=lambda: len(write_buffer))
+    registry.gauge("outbox_pending_reports", "Reports recorded in the outbox but not written to the sheet.",
+                   function=lambda: outbox.count_pending())
+    registry.gauge("telegram_queue_depth", "Bot API calls waiting for the outbound limiter.", labels=("priority",),
+                   function=lambda: {(priority,): depth for priority, depth in bot.limiter.depth().items()})
+    registry.counter("telegram_calls_total", "Bot API calls granted by the outbound limiter.", labels=("priority",),
+                     function=lambda: {(PRIORITY_NAMES[priority],): count for priority, count in bot.limiter.granted.items()})
+    registry.counter("telegram_retry_after_total", "Flood control errors returned by Telegram.",
+                     function=lambda: bot.limiter.retry_after_count)
+    if hasattr(storage, "count_active"):
+        registry.gauge("fsm_active_sessions", "Users in the middle of a conversation.",
+                       function=lambda: storage.count_active())
+    if hasattr(storage, "session_bytes"):
+        registry.gauge("fsm_session_bytes", "Size of the stored FSM sessions, in total and of the largest one.",
+                       labels=("stat",),
+                       function=collect_session_bytes)
+    registry.counter("bot_rejected_updates_total", "Invalid button presses and answers rejected before the handlers.",
+                     labels=("type",), function=lambda: {(kind,): count for kind, count in validation.rejected.items()})
+    registry.gauge("sheets_layout_problems", "Mismatches between the worksheet and the department field map.",
+                   function=lambda: len(sheet_layout.problems))
+    registry.gauge("bot_startup_seconds", "Seconds from process start until the bot was ready for updates.",
+                   function=lambda: dp.data.get("startup_seconds", 0))
 
 # Define states for FSM
 class ReportForm(StatesGroup):
     choosing_department = State()
     confirming_department = State()
     entering_password = State()
-    waiting_for_plan = State()
-    waiting_for_serviced = State()
-    waiting_for_serviced1 = State()
-    waiting_for_load_percentage = State()
-    waiting_for_own = State()
-    waiting_for_closed_orders = State()
-    waiting_for_new_clients = State()
-    waiting_for_completed_work = State()
-    waiting_for_workers = State()
-    waiting_for_worked_hours = State()
-    waiting_for_employee_performance = State()
-    waiting_for_problems = State()
-    waiting_for_plans = State()
-    waiting_for_notes = State()
-    waiting_for_ready_tech = State()
-
-# Department passwords
-DEPARTMENT_PASSWORDS = {
-    "rem1": "1",
-    "rem2": "2",
-    "wash": "3",
-    "to": "4",
-    "breakup": "5"
-}
-
-DEPARTMENT_NAMES = {
-    "rem1": "service1",
-    "rem2": "service2",
-    "wash": "wash",
-    "to": "ТО",
-    "breakup": "breakup"
-}
-
-# Dictionary to store the last report time of users
-user_last_report_time = {}
+    answering = State()  # Answering the department's questions, the current one is stored as "step"
+
 # Define your timezone
 TIMEZONE = pytz.timezone('Europe/Kiev')
 
+# Current day in the bot's timezone
+def today():
+    return datetime.now(TIMEZONE).date()
+
+# The day a report was submitted on (kept in the report so replays write the right date)
+def report_day(user_data):
+    return date.fromisoformat(user_data["date"]) if user_data.get("date") else today()
+
 # Command to set a daily reminder
-@dp.message_handler(commands=['reminder'])
 async def set_reminder(message: types.Message):
-    # Schedule the reminder every day at 4.45 pm Kyiv time (except weekends)
-    scheduler.add_job(send_reminder, CronTrigger(day_of_week='mon-fri', hour=16, minute=45, timezone=TIMEZONE), args=[message.chat.id])
-    await message.answer("Reminder set for every weekday at 16:45.")
+    # One subscription per chat, the daily fan-out job sends the reminders
+    if await reminders.subscribe(message.chat.id):
+        await message.answer("Reminder set for every weekday at 16:45.")
+    else:
+        await message.answer("Reminder is already set for every weekday at 16:45.")
 
 # Function to send the reminder
 async def send_reminder(chat_id):
-    await bot.send_message(chat_id, "Don't forget to submit your daily report!", reply_markup=kb.main)
+    try:
+        await bot.send_message(chat_id, "Don't forget to submit your daily report!", reply_markup=kb.main)
+    except (BotBlocked, ChatNotFound, UserDeactivated):
+        logger.info(f"Chat {chat_id} is unreachable, removing its reminder")
+        await reminders.unsubscribe(chat_id)
+    except TelegramAPIError as e:
+        logger.error(f"Failed to send reminder to chat {chat_id}. Error: {e}")
+
+# Queue the reminder for every subscribed chat whose department has not reported today
+async def send_reminders():
+    # Other workers may have committed reports since the ledger was loaded
+    await ledger.load(today())
+    missing = set(ledger.missing_departments(today()))
+    if not missing:
+        return
+
+    # Reminders are bulk traffic, the outbound limiter sends them behind interactive replies
+    with bulk_priority():
+        tasks = [
+            asyncio.create_task(send_reminder(chat_id))
+            for chat_id, department in await reminders.chats()
+            if department is None or department in missing
+        ]
+    logger.info(f"Sending {len(tasks)} reminder(s), departments missing today: {', '.join(sorted(missing))}")
+    await asyncio.gather(*tasks)
+
+# Command to show the week and month totals of every department
+async def show_summary(message: types.Message):
+    day = today()
+    await message.answer(format_summary(await report_store.summary(day), day))
+
+# Command to show which departments have reported today, served from the status cache
+async def show_status(message: types.Message):
+    day = today()
+    try:
+        status = await read_report_status(day)
+    except (retry.CircuitOpenError,) + retry.REMOTE_ERRORS as e:
+        logger.warning(f"Failed to read the report status. Error: {e}")
+        await message.answer("Google Sheets is not available right now, please try /status again later.")
+        return
+    await message.answer(format_status(status, day))
+
+async def read_report_status(day):
+    """
+        Returns today's report status, reading the sheet only on a cache miss.
+
+        A miss (first use, day rollover, a committed write or an expired entry) costs one
+        batched read of every department's start row, shared by all requests waiting for it.
+
+        Args:
+            day (datetime.date): The current day.
+
+        Returns:
+            dict: The status of every department, see `sheets.ReportStatusCache.get`.
+
+        Raises:
+            retry.CircuitOpenError: If Google Sheets is failing and the read was not attempted.
+            gspread.exceptions.APIError: If the API request fails after all retries.
+            requests.exceptions.RequestException: If a request error occurs after all retries.
+            google.auth.exceptions.GoogleAuthError: If the credentials cannot be refreshed.
+    """
+    status = report_status.get(day) if report_status is not None else None
+    if status is not None:
+        return status
+
+    async with status_refresh:
+        # Workers that are not the leader build the Sheets pipeline on the first /status
+        await load_sheets()
+        status = report_status.get(day)
+        if status is None:
+            sheet = await sheets_retry.lookup(sheet_writer.run, get_refreshed_sheet, day)
+            status = await sheets_retry.call(sheet_writer.run, report_status.load, sheet, day, column_cursors)
+        return status
 
 # Handle /stop command to end the report submission process
-@dp.message_handler(commands=['stop'], state='*')
 async def stop_reporting(message: types.Message, state: FSMContext):
     await state.finish()  # Reset the state
     await message.reply("Reporting stopped.")
 
 # Function to check if the user is allowed to submit a report for the department today
 def can_send_report(user_id, department):
-    current_time = datetime.now(TIMEZONE).date()
-    last_reports = user_last_report_time.get(user_id, {})
-    last_report_date = last_reports.get(department)
-    if last_report_date == current_time:
-        return False
-    return True
+    return ledger.can_send(user_id, department, today())
 
 # Start function for handling the /start command or "Create report" button
-@dp.message_handler(lambda message: CommandStart() or message.text == "Create Report")
 async def start(message: types.Message):
     await message.answer(
             "Hi, you have entered the system to submit a daily report. Please choose the department you want to report for.",
@@ -145,7 +415,6 @@ async def start(message: types.Message):
     await ReportForm.choosing_department.set()
 
 # Handle department selection
-@dp.callback_query_handler(state=ReportForm.choosing_department)
 async def process_department_choice(callback_query: types.CallbackQuery, state: FSMContext):
     department = callback_query.data
     user_id = callback_query.from_user.id
@@ -156,7 +425,7 @@ async def process_department_choice(callback_query: types.CallbackQuery, state:
         await state.update_data(department=department)
 
         # Fetch the descriptive name for the selected department
-        department_name = DEPARTMENT_NAMES.get(department, "department")
+        department_name = DEPARTMENTS[department].name if department in DEPARTMENTS else "department"
 
         # Confirm the selection with the option to reselect
         await bot.answer_callback_query(callback_query.id)
@@ -177,19 +446,8 @@ async def process_department_choice(callback_query: types.CallbackQuery, state:
 
 
 # Handle confirmation or reselecting of department
-@dp.callback_query_handler(state=ReportForm.confirming_department)
 async def confirm_or_reselect_department(callback_query: types.CallbackQuery, state: FSMContext):
-    user_id = callback_query.from_user.id
-    user_data = await state.get_data()
-    department = user_data.get("department")
-
     if callback_query.data == 'confirm':
-        current_time = datetime.now(TIMEZONE).date()
-        if user_id not in user_last_report_time:
-            user_last_report_time[user_id] = {}
-
-        user_last_report_time[user_id][department] = current_time
-
         await bot.answer_callback_query(callback_query.id)
         await bot.send_message(callback_query.from_user.id, "Enter the password for the selected department:")
         await ReportForm.entering_password.set()
@@ -203,431 +461,495 @@ async def confirm_or_reselect_department(callback_query: types.CallbackQuery, st
         await ReportForm.choosing_department.set()
 
 # Validate the entered password
-@dp.message_handler(state=ReportForm.entering_password)
 async def process_password(message: types.Message, state: FSMContext):
     user_data = await state.get_data()
     department = user_data.get("department")
 
-    if message.text == DEPARTMENT_PASSWORDS[department]:
-        await message.answer("Password correct. Let's start reporting.")
-        await ask_first_question(message, state)
+    if message.text == DEPARTMENTS[department].password:
+        fields = ", ".join(question.field for question in DEPARTMENTS[department].questions)
+        await message.answer(
+            "Password correct. Let's start reporting.\n"
+            f"You can also send the whole report in one message, one field=value per line ({fields}), "
+            "or upload a CSV/XLSX file with one report per row."
+        )
+        await ask_first_question(message, state, department)
     else:
         await message.answer("Incorrect password. Please try again:")
 
-async def ask_first_question(message: types.Message,  state: FSMContext):
-    user_data = await state.get_data()
-    department = user_data.get("department")
-
-    if department == "rem1" or department == "rem2":
-        await message.answer("Planned arrival at work")
-        await ReportForm.waiting_for_plan.set()
-    elif department == "wash":
-        await message.answer("Number of washes from 17:00 to 08:00")
-        await ReportForm.waiting_for_serviced.set()
-    elif department == "to":
-        await message.answer("Planned TO records")
-        await ReportForm.waiting_for_plan.set()
-    elif department == "breakup":
-        await message.answer("Planned breakup records")
-        await ReportForm.waiting_for_plan.set()
-
-# Function to check if the input is a valid float
-async def is_float(message: types.Message):
-    user_input = message.text.replace(',', '.')
-    try:
-        float(user_input)
-        return True
-    except ValueError:
-        await message.answer("Please enter a valid numeric value. Try again:")
-        return False
-
+async def ask_first_question(message: types.Message, state: FSMContext, department):
+    await state.update_data(step=0)
+    await message.answer(DEPARTMENTS[department].questions[0].prompt)
+    await ReportForm.answering.set()
 
-# Function to check if the input is an integer
-async def is_int(message: types.Message, state: FSMContext):
-    if not message.text.isdigit():
-        await message.answer("Please enter a numeric value only. Try again:")
-        return False
-    return True
+# Handle the answer to the current question of the department's report
+async def process_answer(message: types.Message, state: FSMContext, session=None):
+    """
+        Validates and stores the answer to the current question, then asks the next one.
 
+        The department's questions, validators and sheet rows come from the DEPARTMENTS table,
+        so every step costs one storage read and one write. The read is done by the
+        ValidationMiddleware, which has already rejected invalid answers.
 
-# Handle the input for the plan
-@dp.message_handler(state=ReportForm.waiting_for_plan)
-async def process_plan(message: types.Message,  state: FSMContext):
-    user_data = await state.get_data()
-    department = user_data.get("department")
+        Args:
+            message (types.Message): The message object containing user input.
+            state (FSMContext): The state context for managing conversation states.
+            session (dict): The session data read by the ValidationMiddleware, None to read it here.
 
-    # Check if the input is an integer
-    if not await is_int(message, state):
+        Returns:
+            None
+    """
+    user_data = session if session is not None else await state.get_data()
+    questions = DEPARTMENTS[user_data["department"]].questions
+    step = user_data.get("step", 0)
+    question = questions[step]
+
+    # A whole report in one message skips the remaining questions
+    if step == 0 and bulk.is_bulk_text(message.text or ""):
+        await process_bulk_answer(message, state, user_data)
         return
 
-    # Store the plan value
-    await state.update_data(plan=int(message.text))
-
-    # Ask the next question based on the department
-    if department == "rem1" or department == "rem2":
-        await message.answer("Readiness plan (departure)")
-        await ReportForm.waiting_for_serviced.set()
-    elif department == "to":
-        await message.answer("Actual amount TO")
-        await ReportForm.waiting_for_serviced.set()
-    elif department == "breakup":
-        await message.answer("Actual amount breakup")
-        await ReportForm.waiting_for_serviced.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_serviced)
-async def process_serviced(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    department = user_data.get("department")
-
-    # Check if the input is an integer
-    if not await is_int(message, state):
+    try:
+        value = question.parse(message.text or "")
+    except ValueError:
+        await message.answer(question.error)
         return
 
-    await state.update_data(serviced=int(message.text))
-
-    if department in ["rem1", "rem2"]:
-        await message.answer("Quantity of ready equipment")
-        await ReportForm.waiting_for_ready_tech.set()
-    elif department == "wash":
-        await message.answer("Actual number of washes from 08:00 to 17:00")
-        await ReportForm.waiting_for_serviced1.set()
-    elif department == "to":
-        await message.answer("Quantity of own vehicles")
-        await ReportForm.waiting_for_own.set()
-    elif department == "breakup":
-        await message.answer("Load percentage")
-        await ReportForm.waiting_for_load_percentage.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_ready_tech)
-async def process_ready_tech(message: types.Message, state: FSMContext):
-    # Check if the input is an integer
-    if not await is_int(message, state):
+    if step + 1 < len(questions):
+        await state.update_data({question.field: value, "step": step + 1})
+        await message.answer(questions[step + 1].prompt)
+    else:
+        user_data[question.field] = value
+        await submit_report(message, state, user_data)
+
+async def process_bulk_answer(message: types.Message, state: FSMContext, user_data):
+    # Validate a whole report sent as one message, every problem is listed in one reply
+    department = user_data["department"]
+    values, errors = bulk.parse_message(DEPARTMENTS[department], message.text)
+    if errors:
+        await message.answer("The report was not sent:\n" + "\n".join(errors) + "\nFix the lines and send it again.")
         return
+    user_data.update(values)
+    await submit_report(message, state, user_data)
 
-    await state.update_data(ready_tech=int(message.text))
-
-    await message.answer("Number of closed orders")
-    await ReportForm.waiting_for_closed_orders.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_load_percentage)
-async def process_load_percentage(message: types.Message, state: FSMContext):
-    user_input = message.text.replace(',', '.')
-
-    # Check if the input is a valid float
-    if not await is_float(message):
-        return
+async def process_report_file(message: types.Message, state: FSMContext):
+    """
+        Validates an uploaded CSV/XLSX file with one report per row and queues the valid reports.
 
-    await state.update_data(load_percentage=float(user_input))
+        Rows name their department and its password unless the user is logged in to a department,
+        so one file can cover several days and departments. The reports are recorded in the outbox
+        in one transaction and the user gets one reply listing the rows that were rejected.
 
-    await message.answer("Number of new clients")
-    await ReportForm.waiting_for_new_clients.set()
+        Args:
+            message (types.Message): The message carrying the document.
+            state (FSMContext): The state context for managing conversation states.
 
-@dp.message_handler(state=ReportForm.waiting_for_serviced1)
-async def process_serviced1(message: types.Message, state: FSMContext):
-    # Check if the input is an integer
-    if not await is_int(message, state):
+        Returns:
+            None
+    """
+    document = message.document
+    if document.file_size and document.file_size > bulk.MAX_FILE_SIZE:
+        await message.answer(f"The file is too large, send at most {bulk.MAX_FILE_SIZE // 1024} KB.")
         return
 
-    await state.update_data(serviced1=int(message.text))
+    department = None
+    if await state.get_state() == ReportForm.answering.state:
+        department = (await state.get_data()).get("department")
 
-    await message.answer("Number of own vehicles:")
-    await ReportForm.waiting_for_own.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_closed_orders)
-async def process_closed_orders(message: types.Message, state: FSMContext):
-    # Check if the input is an integer
-    if not await is_int(message, state):
+    content = (await document.download(destination_file=io.BytesIO())).getvalue()
+    try:
+        result = bulk.parse_rows(bulk.read_rows(content, document.file_name or ""), today(), department)
+    except ValueError:
+        await message.answer("Send the reports as a .csv or .xlsx file.")
         return
-
-    await state.update_data(closed_orders=int(message.text))
-
-    await message.answer("Number of own vehicles:")
-    await ReportForm.waiting_for_own.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_own)
-async def process_own(message: types.Message,  state: FSMContext):
-    # Check if the input is an integer
-    if not await is_int(message, state):
+    except ImportError:
+        await message.answer("Excel files are not supported here, send the reports as a .csv file.")
         return
-
-    await state.update_data(own=int(message.text))
-
-    await message.answer("Number of new clients:")
-
-    await ReportForm.waiting_for_new_clients.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_new_clients)
-async def process_new_clients(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    department = user_data.get("department")
-
-    # Check if the input is an integer
-    if not await is_int(message, state):
+    except UnicodeDecodeError:
+        await message.answer("The file is not UTF-8 encoded text, save it as CSV UTF-8 and send it again.")
         return
 
-    await state.update_data(new_clients=int(message.text))
-
-    if department == "wash":
-        await message.answer("Number of worked hours")
-        await ReportForm.waiting_for_worked_hours.set()
-    elif department == "breakup":
-        await message.answer("Add notes (if none, send ‘-’):")
-        await ReportForm.waiting_for_notes.set()
-    else:
-        await message.answer("Number of employees:")
-        await ReportForm.waiting_for_workers.set()
-
-@dp.message_handler(state=ReportForm.waiting_for_workers)
-async def process_workers(message: types.Message, state: FSMContext):
-    # Check if the input is an integer
-    if not await is_int(message, state):
-        return
+    # One report per department a day, as through the questions, also when the same file is sent twice
+    user_id = message.from_user.id
+    reports = []
+    submitted = set()
+    if result.reports:
+        submitted = await report_store.submitted(user_id, min(map(report_day, result.reports)), today())
+    for report in result.reports:
+        if (report["department"], report["date"]) in submitted or (
+                report_day(report) == today() and not can_send_report(user_id, report["department"])):
+            result.errors.append(f"{report['department']}: already reported for {report_day(report).strftime('%d/%m/%Y')}")
+        else:
+            reports.append(dict(report, user_id=user_id))
+
+    if reports:
+        await queue_reports(message.chat.id, reports)
+    # A report in progress is done once the file covered its department
+    if department and any(report["department"] == department for report in reports):
+        await state.finish()
+    lines = [f"{len(reports)} report(s) sent."]
+    if result.errors:
+        lines.append(f"{len(result.errors)} problem(s) found, these rows were not sent:")
+        lines.extend(result.errors[:50])
+    await message.answer("\n".join(lines), reply_markup=kb.main if reports else None)
+
+async def queue_reports(chat_id, reports):
+    # Record finished reports in the durable outbox before confirming them, the drainer writes them to the sheet
+    entry_ids = await outbox.append_many(chat_id, [(report["department"], report) for report in reports])
+    await report_store.append_many([
+        (entry_id, report["department"], report_day(report), report) for entry_id, report in zip(entry_ids, reports)
+    ])
+    outbox_ready.set()
+    for report in reports:
+        ledger.mark_pending(report["user_id"], report["department"], report_day(report))
+
+async def submit_report(message: types.Message, state: FSMContext, user_data):
+    """
+        Saves a finished report so that it is written to the Google Sheets document.
 
-    await state.update_data(workers=int(message.text))
+        Args:
+            message (types.Message): The message object containing the last answer.
+            state (FSMContext): The state context for managing conversation states.
+            user_data (dict): The collected report fields.
 
-    await message.answer("Number of worked hours:")
-    await ReportForm.waiting_for_worked_hours.set()
+        Returns:
+            None
+    """
+    user_data.pop("step", None)
+    user_data.update(user_id=message.from_user.id, date=today().isoformat())
+    await queue_reports(message.chat.id, [user_data])
 
-@dp.message_handler(state=ReportForm.waiting_for_worked_hours)
-async def process_worked_hours(message: types.Message, state: FSMContext):
-    user_input = message.text.replace(',', '.')
+    await message.answer("Your report has been successfully sent!", reply_markup=kb.main)
 
-    if not await is_float(message):
-        return
+    # Finish the FSM context
+    await state.finish()
 
-    await state.update_data(worked_hours=float(user_input))
+async def drain_outbox(poll_interval=5):
+    """
+        Background task that replays pending outbox entries into the Google Sheets document.
 
-    await message.answer("Employee performance:")
-    await ReportForm.waiting_for_employee_performance.set()
+        An unexpected error (e.g. a locked database) is logged and the loop continues after a
+        growing delay, so the reports already confirmed to users are never left behind.
 
-@dp.message_handler(state=ReportForm.waiting_for_employee_performance)
-async def process_employee_performance(message: types.Message, state: FSMContext):
-    user_input = message.text.replace(',', '.')
+        Args:
+            poll_interval (float): Seconds to wait for new entries before checking the outbox again.
 
-    if not await is_float(message):
+        Returns:
+            None
+    """
+    backoff = 1
+    while True:
+        try:
+            await drain_outbox_once(poll_interval)
+        except Exception:
+            logger.exception(f"Outbox drainer failed, retrying in {backoff} seconds")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, OUTBOX_RETRY_DELAY)
+        else:
+            backoff = 1
+
+async def drain_outbox_once(poll_interval):
+    # Replay the pending entries, or wait up to poll_interval for new ones
+    # While Google Sheets is failing the reports stay in the outbox until the breaker allows a probe
+    retry_in = sheets_retry.breaker.retry_in()
+    if retry_in:
+        await asyncio.sleep(retry_in)
+
+    outbox_ready.clear()
+    entries = await outbox.pending()
+    if not entries:
+        try:
+            await asyncio.wait_for(outbox_ready.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
         return
 
-    await state.update_data(employee_performance=float(user_input))
-
-    await message.answer("Problems detected today (if none, send ‘-’):")
-    await ReportForm.waiting_for_problems.set()
+    await replay_reports(entries)
 
-@dp.message_handler(state=ReportForm.waiting_for_problems)
-async def process_problems(message: types.Message, state: FSMContext):
-    await state.update_data(problems=message.text)
-
-    await message.answer("Plans for solving (if none, send ‘-’):")
-    await ReportForm.waiting_for_plans.set()
+async def replay_reports(entries):
+    """
+        Writes outbox entries to the sheet and marks them done.
 
-@dp.message_handler(state=ReportForm.waiting_for_plans)
-async def process_plans(message: types.Message, state: FSMContext):
-    await state.update_data(plans=message.text)
+        Columns are reserved one entry after another in the order the reports were recorded,
+        then all reports are written in parallel, so the write-behind buffer sends them in
+        as few requests as possible.
 
-    await message.answer("Add notes (if none, send ‘-’):")
-    await ReportForm.waiting_for_notes.set()
+        Args:
+            entries (list): Pending outbox entries, oldest first.
 
-# Finds the next empty column in the specified row with retry logic for handling API errors
-def find_next_empty_column(sheet, row, max_retries=5, base_delay=2):
+        Returns:
+            None
+    """
+    ready = []
+    for entry in entries:
+        department = entry["department"]
+        try:
+            # Every report goes to the shard of the day it was submitted on
+            sheet = await sheets_retry.lookup(sheet_writer.run, get_refreshed_sheet, report_day(entry["payload"]))
+
+            # The column is reserved once and stored with the entry, so a replay rewrites the same cells
+            if entry["column_index"] is None:
+                entry["column_index"] = await column_allocator.allocate(
+                    sheet, department, entry["id"],
+                    lambda: sheets_retry.lookup(sheet_writer.run, column_cursors.next_column, sheet, department)
+                )
+                await outbox.assign_column(entry["id"], entry["column_index"])
+                column_cursors.advance(sheet, department, entry["column_index"])
+            else:
+                await column_allocator.claim(sheet, department, entry["id"], entry["column_index"])
+
+            # Grow the sheet before the write if the report's cells are past its last column
+            last_column = entry["column_index"] + max(question.shift for question in DEPARTMENTS[department].questions)
+            await sheets_retry.lookup(sheet_writer.run, sheet_client.ensure_columns, sheet, last_column)
+        except retry.CircuitOpenError as e:
+            logger.info(f"Keeping {len(entries) - len(ready)} report(s) in the outbox: {e}")
+            break
+        except retry.REMOTE_ERRORS as e:
+            await report_failed(entry, e)
+            continue
+        ready.append((entry, sheet))
+
+    await asyncio.gather(*(replay_report(entry, sheet) for entry, sheet in ready))
+
+async def replay_report(entry, sheet):
+    # Write one outbox entry to its reserved column
+    department = entry["department"]
+    try:
+        await update_sheet_async(sheet, department, DEPARTMENT_START_ROWS[department], entry["column_index"], entry["payload"])
+    except retry.CircuitOpenError as e:
+        logger.info(f"Keeping a {department} report in the outbox: {e}")
+        return
+    except retry.REMOTE_ERRORS as e:
+        await report_failed(entry, e)
+        return
+    await outbox.mark_done(entry["id"])
+    await column_allocator.release(entry["id"])
+
+    # Only a committed write counts as today's submission
+    payload = entry["payload"]
+    await ledger.record(payload.get("user_id", entry["chat_id"]), department, report_day(payload))
+    await reminders.set_department(entry["chat_id"], department)
+    report_status.invalidate()
+
+async def report_failed(entry, error):
+    # Postpone a failed entry and tell the user once that the report is waiting
+    attempts = await outbox.mark_failed(entry["id"], error, OUTBOX_RETRY_DELAY)
+    if attempts == 1 and entry["chat_id"]:
+        try:
+            await bot.send_message(
+                entry["chat_id"],
+                "Google Sheets is not available right now. Your report is saved and will be recorded automatically."
+            )
+        except TelegramAPIError as e:
+            # A blocked bot or a Telegram outage must not stop the replay of the other entries
+            logger.warning(f"Failed to tell chat {entry['chat_id']} that its report is waiting. Error: {e}")
+
+async def update_sheet_async(sheet, department, start_row, next_column_index, user_data):
     """
-        Finds the next empty column in the specified row of a Google Sheets spreadsheet.
+        Updates the Google Sheets document with the user data asynchronously.
 
         Args:
             sheet (gspread.models.Sheet): The Google Sheets sheet object.
-            row (int): The row number to search for an empty column.
-            max_retries (int): Maximum number of retry attempts in case of API errors.
-            base_delay (int): Base delay in seconds before retrying, increased exponentially.
+            department (str): The department for which data is being updated.
+            start_row (int): The starting row index for updates.
+            next_column_index (int): The index of the next empty column.
+            user_data (dict): Dictionary containing user data to be updated.
 
         Returns:
-            int: The index of the next empty column.
+            None
 
         Raises:
-            gspread.exceptions.APIError: If the API request fails after max_retries.
-            requests.exceptions.ConnectionError: If there is a connection error after max_retries.
+            retry.CircuitOpenError: If Google Sheets is failing and the write was not attempted.
+            gspread.exceptions.APIError: If the API request fails after all retries.
+            requests.exceptions.RequestException: If a request error occurs after all retries.
+            google.auth.exceptions.GoogleAuthError: If the credentials cannot be refreshed.
     """
-    col_index = 3  # Starting from column C
-    retries = 0
+    updates = sheets.report_updates(DEPARTMENTS[department].questions, start_row, next_column_index,
+                                    report_day(user_data), user_data)
 
+    try:
+        # Queue the updates in the write-behind buffer and wait for the flush that carries them
+        await write_buffer.submit(sheet, updates)
+    except retry.REMOTE_ERRORS:
+        # The sheet may have changed under us, re-read the row on the next report
+        column_cursors.invalidate(department)
+        raise
+    logger.info(f"Successfully updated Google Sheets for {department}")
+    column_cursors.advance(sheet, department, next_column_index)
+
+async def purge_expired_sessions(interval=60 * 60):
+    """
+        Background task that removes abandoned FSM sessions from storages that support it.
+
+        Users whose report was still in progress are told that it was discarded.
+
+        Args:
+            interval (float): Seconds between two sweeps.
+
+        Returns:
+            None
+    """
     while True:
-        try:
-            # Retrieve the value of the cell at the current column index
-            cell_value = sheet.cell(row, col_index).value
-            if not cell_value:
-                return col_index # Return the column index if cell is empty
-            col_index += 1
-        except (gspread.exceptions.APIError, requests.exceptions.ConnectionError) as e:
-            if retries < max_retries:
-                # Calculate delay with exponential backoff
-                delay = base_delay * (2 ** retries)
-                retries += 1
-                logger.warning(f"Retrying to find empty column after {delay} seconds. Error: {e}")
-                time.sleep(delay) # Pause before retrying
-            else:
-                logger.error(f"Failed to find empty column after {max_retries} attempts. Error: {e}")
-                raise
+        await asyncio.sleep(interval)
+        removed = await storage.purge_expired()
+        if not removed:
+            continue
+        abandoned = [chat for chat, user, state in removed if state is not None]
+        logger.info(f"Removed {len(removed)} expired FSM session(s), {len(abandoned)} with a report in progress")
+
+        # Notices are bulk traffic, the outbound limiter sends them behind interactive replies
+        with bulk_priority():
+            await asyncio.gather(*(notify_expired_session(chat_id) for chat_id in abandoned))
+
+async def notify_expired_session(chat_id):
+    try:
+        await bot.send_message(
+            chat_id,
+            "Your unfinished report was discarded after a long time without an answer. "
+            "Press Create Report to start again.",
+            reply_markup=kb.main
+        )
+    except TelegramAPIError as e:
+        logger.info(f"Could not tell chat {chat_id} that its session expired. Error: {e}")
 
-@dp.message_handler(state=ReportForm.waiting_for_notes)
-async def process_notes(message: types.Message, state: FSMContext):
+def register_handlers(dp):
+    # Handlers are tried in this order, /reminder, /summary, /status and /stop work at any step of a report
+    dp.register_message_handler(set_reminder, commands=['reminder'], state='*')
+    dp.register_message_handler(show_summary, commands=['summary'], state='*')
+    dp.register_message_handler(show_status, commands=['status'], state='*')
+    dp.register_message_handler(stop_reporting, commands=['stop'], state='*')
+    dp.register_message_handler(process_report_file, content_types=types.ContentType.DOCUMENT, state='*')
+    dp.register_message_handler(start, CommandStart())
+    dp.register_message_handler(start, text="Create Report")
+    dp.register_callback_query_handler(process_department_choice, state=ReportForm.choosing_department)
+    dp.register_callback_query_handler(confirm_or_reselect_department, state=ReportForm.confirming_department)
+    dp.register_message_handler(process_password, state=ReportForm.entering_password)
+    dp.register_message_handler(process_answer, state=ReportForm.answering)
+
+def start_scheduler():
+    global scheduler
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    # Schedule the reminder every day at 4.45 pm Kyiv time (except weekends), replacing the job on restart
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(
+        send_reminders,
+        CronTrigger(day_of_week='mon-fri', hour=16, minute=45, timezone=TIMEZONE),
+        id="daily-reminder",
+        replace_existing=True
+    )
+    scheduler.start()
+
+async def warm_up_sheet():
     """
-        Processes and saves user notes to the Google Sheets document.
+        Authorizes, opens the worksheet and reads all department rows with one batched request.
 
-        Args:
-            message (types.Message): The message object containing user input.
-            state (FSMContext): The state context for managing conversation states.
+        Fills the column cursors, the layout cache and the status cache and logs every mismatch between the sheet
+        and the DEPARTMENTS table, so the first report after a deploy costs the same as any other. A failed warm-up
+        is only logged.
 
         Returns:
             None
-        """
-    # Save the received notes to the state
-    await state.update_data(notes=message.text)
+    """
+    try:
+        sheet = await sheets_retry.lookup(sheet_writer.run, get_refreshed_sheet, today())
+        problems = await sheets_retry.call(sheet_writer.run, sheets.warm_up, sheet, column_cursors, sheet_layout,
+                                           report_status, today())
+    except Exception as e:
+        # Any failure (auth, a missing spreadsheet, an outage) must not keep the drainer and scheduler from starting
+        logger.warning(f"Could not warm up the sheet at startup, the rows will be read on first use. Error: {e!r}")
+        return
 
-    await message.answer("Your report has been successfully sent!", reply_markup=kb.main)
+    for problem in problems:
+        logger.warning(f"Sheet layout does not match the department table: {problem}")
+    logger.info(f"Sheet warmed up, {len(problems)} layout problem(s) found")
 
-    sheet = get_refreshed_sheet()
+async def load_sheets():
+    # Import the heavy modules and build the Sheets pipeline once, concurrent callers wait for the same load
+    global sheets_loading
+    if sheets_loading is None:
+        sheets_loading = asyncio.ensure_future(_load_sheets())
+    # A caller that is cancelled (e.g. a leader stepping down) must not cancel the others' load
+    await asyncio.shield(sheets_loading)
 
-    # Retrieve user data from the state
-    user_data = await state.get_data()
-    department = user_data.get("department")
+async def _load_sheets():
+    global sheets_loading
+    try:
+        # The lazy modules are not safe to load from two threads, only this task loads them
+        await asyncio.get_running_loop().run_in_executor(
+            None, preload, gspread, requests, retry, sheets, "apscheduler.schedulers.asyncio", "apscheduler.triggers.cron"
+        )
+        create_sheets_pipeline()
+    except BaseException:
+        # Let the next caller try again
+        sheets_loading = None
+        raise
+
+async def start_services():
+    """
+        Background task that brings up Google Sheets and the scheduler once the bot receives updates.
+
+        The heavy modules are imported on a worker thread, so the event loop keeps answering
+        users meanwhile. Reports finished before Sheets is up wait in the outbox.
 
-    # Define starting rows for different departments
-    department_start_rows = {
-        "rem1": 4,
-        "rem2": 18,
-        "wash": 32,
-        "to": 43,
-        "breakup": 55
-    }
+        Returns:
+            None
+    """
+    started = time.perf_counter()
+    await load_sheets()
+    await warm_up_sheet()
 
-    # Get the starting row for the specified department
-    department_start_row = department_start_rows[department]
+    # Keep the Google credentials fresh in the background instead of refreshing them per report
+    leader_tasks.append(asyncio.create_task(sheet_client.keep_credentials_fresh(sheet_writer)))
 
-    # Determine the next empty column in the department's starting row
-    next_column_index = find_next_empty_column(sheet, department_start_row)
+    # Replay the reports left in the outbox and keep writing new ones, other workers' reports are found by polling
+    leader_tasks.append(asyncio.create_task(drain_outbox(poll_interval=1)))
 
-    # Asynchronously update the Google Sheet
-    asyncio.create_task(update_sheet_async(sheet, department, department_start_row, next_column_index, user_data))
+    start_scheduler()
+    logger.info(f"Google Sheets and the scheduler started in {time.perf_counter() - started:.2f} seconds")
 
-    # Finish the FSM context
-    await state.finish()
+async def stop_services():
+    # Stop writing to the sheet and sending reminders, at shutdown or when another worker became the leader
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    for task in leader_tasks:
+        task.cancel()
+    leader_tasks.clear()
+
+    # Send the reports that are still buffered, unfinished outbox entries are replayed by the next leader
+    if write_buffer is not None:
+        await write_buffer.flush()
 
-async def update_sheet_async(sheet, department, start_row, next_column_index, user_data, max_retries=5, base_delay=2):
+async def hold_leadership():
     """
-        Updates the Google Sheets document with the user data asynchronously.
+        Background task that keeps renewing the leader lease.
 
-        Args:
-            sheet (gspread.models.Sheet): The Google Sheets sheet object.
-            department (str): The department for which data is being updated.
-            start_row (int): The starting row index for updates.
-            next_column_index (int): The index of the next empty column.
-            user_data (dict): Dictionary containing user data to be updated.
-            max_retries (int): Maximum number of retry attempts in case of API errors.
-            base_delay (int): Base delay in seconds before retrying, increased exponentially.
+        The process that holds the lease starts Google Sheets, the outbox drainer and the
+        scheduler; a process that loses it stops them, so reminders are sent by one process only.
 
         Returns:
             None
-
-        Raises:
-            gspread.exceptions.APIError: If the API request fails after max_retries.
-            requests.exceptions.RequestException: If a request error occurs after max_retries.
     """
-    updates = []
-    next_column_letter = utils.rowcol_to_a1(1, next_column_index)[0]
-    next_column_letter_for_plan = utils.rowcol_to_a1(1, next_column_index + 1)[0]
-
-    sheet.update_acell(f"{next_column_letter}{start_row}", datetime.now().strftime("%d/%m/%Y"))
-
-    # Define the update patterns for different departments
-    department_updates = {
-        "wash": [
-            ('serviced', 1),
-            ('serviced1', 2),
-            ('own', 3),
-            ('new_clients', 4),
-            ('worked_hours', 5),
-            ('employee_performance', 6),
-            ('problems', 7),
-            ('plans', 8),
-            ('notes', 9)
-        ],
-        "rem1": [
-            ('plan', 1, next_column_letter_for_plan),
-            ('serviced', 2, next_column_letter_for_plan),
-            ('ready_tech', 3),
-            ('own', 4),
-            ('closed_orders', 5),
-            ('new_clients', 6),
-            ('workers', 7),
-            ('worked_hours', 8),
-            ('employee_performance', 9),
-            ('problems', 10),
-            ('plans', 11),
-            ('notes', 12)
-        ],
-        "rem2": [
-            ('plan', 1, next_column_letter_for_plan),
-            ('serviced', 2, next_column_letter_for_plan),
-            ('ready_tech', 3),
-            ('own', 4),
-            ('closed_orders', 5),
-            ('new_clients', 6),
-            ('workers', 7),
-            ('worked_hours', 8),
-            ('employee_performance', 9),
-            ('problems', 10),
-            ('plans', 11),
-            ('notes', 12)
-        ],
-        "to": [
-            ('plan', 1, next_column_letter_for_plan),
-            ('serviced', 2),
-            ('own', 3),
-            ('new_clients', 4),
-            ('workers', 5),
-            ('worked_hours', 6),
-            ('employee_performance', 7),
-            ('problems', 8),
-            ('plans', 9),
-            ('notes', 10)
-        ],
-        "breakup": [
-            ('plan', 1, next_column_letter_for_plan),
-            ('serviced', 2),
-            ('load_percentage', 3),
-            ('new_clients', 4),
-            ('notes', 5)
-        ]
-    }
-
-    # Prepare the updates for the sheet
-    for item in department_updates.get(department, []):
-        column_letter = next_column_letter if len(item) == 2 else item[2]
-        updates.append({
-            'range': f"{column_letter}{start_row + item[1]}",
-            'values': [[user_data.get(item[0])]]
-        })
-        time.sleep(0.01) # Brief delay to avoid overwhelming the API
-
-    # Retry logic with exponential backoff for batch updates
-    for attempt in range(max_retries):
+    while True:
         try:
-            # Try to perform the batch update
-            sheet.batch_update(updates)
-            logger.info(f"Successfully updated Google Sheets on attempt {attempt + 1}")
-            break  # Exit the retry loop if successful
-        except (gspread.exceptions.APIError, requests.exceptions.RequestException) as e:
-            if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)  # Exponential backoff
-                logger.warning(
-                    f"Failed to update Google Sheets (attempt {attempt + 1}/{max_retries}). Retrying in {delay} seconds. Error: {e}")
-                await asyncio.sleep(delay)  # Wait before retrying
-            else:
-                logger.error(f"Failed to update Google Sheets after {max_retries} attempts. Error: {e}")
-                await bot.send_message(user_data['chat_id'], "An error occurred while recording the report. Please try again later.")
-                return
+            leader = await leader_lease.acquire()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to renew the leader lease. Error: {e}")
+            leader = False
+
+        if leader and not leader_tasks:
+            leader_tasks.append(asyncio.create_task(start_services()))
+        elif not leader and leader_tasks:
+            await stop_services()
+        await asyncio.sleep(leader_lease.ttl / 3)
 
 async def on_startup(dp):
     """
        Called when the bot starts up.
 
+       Only local state is loaded before the bot starts receiving updates, Google Sheets
+       and the scheduler are started in the background by `start_services`.
+
        Args:
            dp (Dispatcher): The Dispatcher instance.
 
@@ -636,6 +958,32 @@ async def on_startup(dp):
     """
     print("Bot is starting...")
 
+    if METRICS_PORT:
+        dp["metrics_server"] = await start_metrics_server(
+            metrics_registry, host=os.getenv("METRICS_HOST", "127.0.0.1"), port=METRICS_PORT
+        )
+
+    # Load today's submissions, reports still in the outbox count as pending
+    await ledger.load(today())
+    unfinished = await outbox.unfinished()
+    for entry in unfinished:
+        payload = entry["payload"]
+        ledger.mark_pending(payload.get("user_id", entry["chat_id"]), entry["department"], report_day(payload))
+    logger.info(f"{len(unfinished)} report(s) pending in the outbox")
+    await column_allocator.purge()
+
+    background_tasks.append(asyncio.create_task(hold_leadership()))
+    if hasattr(storage, "purge_expired"):
+        background_tasks.append(asyncio.create_task(purge_expired_sessions(
+            float(os.getenv("FSM_SWEEP_INTERVAL", 10 * 60))  # Seconds between two sweeps of expired sessions
+        )))
+
+    dp["startup_seconds"] = elapsed = time.perf_counter() - STARTED_AT
+    if elapsed > STARTUP_BUDGET:
+        logger.warning(f"Startup took {elapsed:.2f} seconds, over the budget of {STARTUP_BUDGET} seconds")
+    else:
+        logger.info(f"Ready to receive updates {elapsed:.2f} seconds after start")
+
 async def on_shutdown(dp):
     """
         Called when the bot shuts down.
@@ -648,8 +996,50 @@ async def on_shutdown(dp):
     """
     print("Bot is shutting down...")
 
+    for task in background_tasks:
+        task.cancel()
+    await stop_services()
+    await leader_lease.release()
+    leader_lease.close()
+    if "metrics_server" in dp.data:
+        await dp["metrics_server"].cleanup()
+
+    outbox.close()
+    column_allocator.close()
+    ledger.close()
+    reminders.close()
+    report_store.close()
+
 if __name__ == '__main__':
-    dp.register_message_handler(stop_reporting, commands=['stop'], state='*')
-    dp.register_message_handler(set_reminder, commands=['reminder'], state='*')
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
+    load_dotenv()
+
+    # BOT_MODE=supervisor polls Telegram in this process and handles the updates in BOT_WORKERS worker processes
+    if os.getenv("BOT_MODE", "polling") == "supervisor":
+        from supervisor import run_supervisor
+
+        run_supervisor(int(os.getenv("BOT_WORKERS", os.cpu_count() or 1)))
+        raise SystemExit
+
+    create_app()
+
+    # BOT_MODE=webhook runs an aiohttp webhook server, anything else keeps long polling
+    if os.getenv("BOT_MODE", "polling") == "webhook":
+        from webhook import start_webhook
+
+        webhook_path = os.getenv("WEBHOOK_PATH", "/webhook")
+        start_webhook(
+            dp,
+            url=os.getenv("WEBHOOK_HOST", "").rstrip("/") + webhook_path,  # Public address of the load balancer
+            path=webhook_path,
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            host=os.getenv("WEBAPP_HOST", "0.0.0.0"),
+            port=int(os.getenv("WEBAPP_PORT", 8080)),
+            drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30)),
+            drain_grace=float(os.getenv("WEBHOOK_DRAIN_GRACE", 5)),  # Seconds /healthz reports 503 before the server stops
+            on_startup=on_startup,
+            on_shutdown=on_shutdown
+        )
+    else:
+        from aiogram.utils import executor
 
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
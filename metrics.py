@@ -0,0 +1,234 @@
+import cProfile
+import inspect
+import io
+import logging
+import pstats
+import random
+import time
+
+from aiohttp import web
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cached lookup to a slow Google request
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metric:
+    """
+        Base of all metrics: a name, a help text and one value per combination of labels.
+
+        Args:
+            name (str): Metric name in Prometheus format.
+            documentation (str): Text of the HELP line.
+            labels (tuple): Names of the labels the metric is split by.
+            function (callable): Optional callback evaluated at scrape time instead of the stored values.
+                It may be a coroutine function and returns either a number (metric without labels)
+                or a dict mapping tuples of label values to numbers.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.function = function
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    async def samples(self):
+        # Yield (suffix, label names, label values, value) tuples
+        values = self.values
+        if self.function is not None:
+            values = self.function()
+            if inspect.isawaitable(values):
+                values = await values
+            if not isinstance(values, dict):
+                values = {(): values}
+        return [("", self.labels, key, value) for key, value in values.items()]
+
+    async def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in await self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {float(value):g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    """
+        Cumulative histogram with fixed buckets, exposed as `_bucket`, `_sum` and `_count` series.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            # One counter per bucket plus +Inf, then the sum of all values
+            counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[len(self.buckets)] += 1
+        counts[-1] += value
+
+    async def samples(self):
+        samples = []
+        names = self.labels + ("le",)
+        for key, counts in self.values.items():
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                samples.append(("_bucket", names, key + (bound,), count))
+            samples.append(("_sum", self.labels, key, counts[-1]))
+            samples.append(("_count", self.labels, key, counts[len(self.buckets)]))
+        return samples
+
+
+class Registry:
+    """
+        The set of metrics exposed on the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    async def expose(self):
+        """
+            Renders all metrics in the Prometheus text exposition format.
+
+            A metric whose callback fails is skipped so one broken source cannot break the scrape.
+
+            Returns:
+                str: The response body.
+        """
+        blocks = []
+        for metric in self.metrics:
+            try:
+                blocks.append(await metric.expose())
+            except Exception as e:
+                logger.warning(f"Failed to collect metric {metric.name}. Error: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+async def start_metrics_server(registry, host="127.0.0.1", port=9100, path="/metrics"):
+    """
+        Serves the registry on a local HTTP endpoint.
+
+        Args:
+            registry (Registry): The metrics to expose.
+            host (str): Interface to listen on, local only by default.
+            port (int): Port to listen on.
+            path (str): Path of the endpoint.
+
+        Returns:
+            aiohttp.web.AppRunner: The runner, call `cleanup()` on it to stop the server.
+    """
+    async def handle(request):
+        return web.Response(text=await registry.expose(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}{path}")
+    return runner
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+        Times every message and callback handler, labelled by handler and FSM state.
+
+        A random `profile_rate` share of updates is run under cProfile; when such an update
+        takes longer than `slow_threshold` seconds its hottest functions are logged. Only one
+        update is profiled at a time.
+
+        Args:
+            latency (Histogram): Histogram with `handler` and `state` labels.
+            profile_rate (float): Share of updates to profile, 0 disables profiling.
+            slow_threshold (float): Seconds above which a profiled update is logged.
+    """
+
+    def __init__(self, latency, profile_rate=0.0, slow_threshold=1.0):
+        super().__init__()
+        self.latency = latency
+        self.profile_rate = profile_rate
+        self.slow_threshold = slow_threshold
+        self._profiling = False
+
+    async def on_pre_process_update(self, update, data):
+        data["metrics_started"] = time.perf_counter()
+        if self.profile_rate and not self._profiling and random.random() < self.profile_rate:
+            self._profiling = True
+            data["metrics_profiler"] = profiler = cProfile.Profile()
+            profiler.enable()
+
+    async def on_post_process_update(self, update, results, data):
+        profiler = data.get("metrics_profiler")
+        if profiler is None:
+            return
+        profiler.disable()
+        self._profiling = False
+
+        elapsed = time.perf_counter() - data["metrics_started"]
+        if elapsed >= self.slow_threshold:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(15)
+            logger.warning(f"Slow update {update.update_id} took {elapsed:.3f} seconds:\n{output.getvalue()}")
+
+    async def _pre_process(self, obj, data):
+        data["metrics_started"] = time.perf_counter()
+
+    async def _process(self, obj, data):
+        # Remember which handler matched, the state filter has resolved the state by now
+        data["metrics_handler"] = current_handler.get().__name__
+        data["metrics_state"] = data.get("raw_state", "*" if "state" in data else None)
+
+    async def _post_process(self, obj, results, data):
+        self.latency.observe(
+            time.perf_counter() - data["metrics_started"],
+            handler=data.get("metrics_handler", "unhandled"),
+            state=data.get("metrics_state") or "none"
+        )
+
+    on_pre_process_message = on_pre_process_callback_query = _pre_process
+    on_process_message = on_process_callback_query = _process
+    on_post_process_message = on_post_process_callback_query = _post_process
@@ -0,0 +1,106 @@
+import json
+import time
+import uuid
+
+from db import SQLiteDatabase, transaction
+
+
+class Outbox(SQLiteDatabase):
+    """
+        Durable append-only outbox of finished reports.
+
+        A report is recorded here before the user is told it was sent, and a background
+        drainer replays pending entries into the sheet. The entry id is the report's
+        idempotency key: the column chosen for a report is stored with it, so a replay
+        after a crash or a failed attempt rewrites the same cells instead of adding a
+        second column.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            chat_id INTEGER,
+            department TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            column_index INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            done_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (done_at, next_attempt_at);
+    """
+
+    async def append_many(self, chat_id, reports):
+        """
+            Records several finished reports in one transaction.
+
+            Args:
+                chat_id (int): Chat to notify about the outcome.
+                reports (list): (department, user_data) pairs.
+
+            Returns:
+                list: The idempotency keys of the entries, in the same order.
+        """
+        created_at = time.time()
+        rows = [
+            (uuid.uuid4().hex, created_at, chat_id, department, json.dumps(user_data))
+            for department, user_data in reports
+        ]
+        await self.run(self._append, rows)
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _append(conn, rows):
+        with transaction(conn):
+            conn.executemany("INSERT INTO outbox (id, created_at, chat_id, department, payload) VALUES (?, ?, ?, ?, ?)", rows)
+
+    async def pending(self, limit=100):
+        # Entries that are not written yet and are due for another attempt, oldest first
+        return await self.run(self._pending, limit)
+
+    @staticmethod
+    def _pending(conn, limit):
+        rows = conn.execute(
+            "SELECT * FROM outbox WHERE done_at IS NULL AND next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+    async def unfinished(self):
+        # All entries that are not written yet, due or not
+        rows = await self.run(lambda conn: conn.execute(
+            "SELECT * FROM outbox WHERE done_at IS NULL ORDER BY created_at"
+        ).fetchall())
+        return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+    async def count_pending(self):
+        return await self.run(lambda conn: conn.execute("SELECT COUNT(*) FROM outbox WHERE done_at IS NULL").fetchone()[0])
+
+    async def assign_column(self, entry_id, column_index):
+        await self.run(lambda conn: conn.execute(
+            "UPDATE outbox SET column_index = ? WHERE id = ?", (column_index, entry_id)
+        ))
+
+    async def mark_done(self, entry_id):
+        await self.run(lambda conn: conn.execute(
+            "UPDATE outbox SET done_at = ?, last_error = NULL WHERE id = ?", (time.time(), entry_id)
+        ))
+
+    async def mark_failed(self, entry_id, error, retry_delay):
+        """
+            Records a failed attempt and postpones the entry.
+
+            Returns:
+                int: The number of attempts made so far.
+        """
+        return await self.run(self._mark_failed, entry_id, str(error), retry_delay)
+
+    @staticmethod
+    def _mark_failed(conn, entry_id, error, retry_delay):
+        conn.execute(
+            "UPDATE outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (error, time.time() + retry_delay, entry_id)
+        )
+        return conn.execute("SELECT attempts FROM outbox WHERE id = ?", (entry_id,)).fetchone()[0]
@@ -0,0 +1,46 @@
+import time
+
+from db import SQLiteDatabase
+
+
+class ReminderRegistry(SQLiteDatabase):
+    """
+        Persistent reminder subscriptions, one row per chat.
+
+        Subscribing is idempotent, so repeated /reminder commands never add a second
+        reminder. Each chat also remembers the department it last reported for, which
+        lets the fan-out skip chats whose department has already reported today.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS reminders (
+            chat_id INTEGER PRIMARY KEY,
+            department TEXT,
+            created_at REAL NOT NULL
+        );
+    """
+
+    async def subscribe(self, chat_id):
+        """
+            Subscribes a chat to the daily reminder.
+
+            Returns:
+                bool: False if the chat was already subscribed.
+        """
+        return await self.run(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO reminders (chat_id, created_at) VALUES (?, ?)", (chat_id, time.time())
+        ).rowcount == 1)
+
+    async def unsubscribe(self, chat_id):
+        await self.run(lambda conn: conn.execute("DELETE FROM reminders WHERE chat_id = ?", (chat_id,)))
+
+    async def set_department(self, chat_id, department):
+        # Remember the department a subscribed chat reports for
+        await self.run(lambda conn: conn.execute(
+            "UPDATE reminders SET department = ? WHERE chat_id = ?", (department, chat_id)
+        ))
+
+    async def chats(self):
+        # All subscribed chats with the department they last reported for
+        return await self.run(lambda conn: conn.execute("SELECT chat_id, department FROM reminders").fetchall())
+
@@ -0,0 +1,151 @@
+import time
+from datetime import timedelta
+
+from db import SQLiteDatabase, transaction
+from departments import DEPARTMENTS, parse_text
+
+# Every numeric answer of any department, one column each in the reports table
+NUMERIC_FIELDS = tuple(dict.fromkeys(
+    question.field
+    for department in DEPARTMENTS.values()
+    for question in department.questions
+    if question.parse is not parse_text
+))
+
+# Columns summed by the summary, kept in the covering index so it never reads the table
+SUMMARY_FIELDS = ("plan", "serviced", "worked_hours")
+
+
+class ReportStore(SQLiteDatabase):
+    """
+        Append-only local copy of the numeric fields of every finished report.
+
+        One row per report with one REAL column per numeric field, so aggregates are plain
+        SUM/COUNT queries. The covering index on (day, department, plan, serviced,
+        worked_hours) answers a summary from the index alone, without reading the rows or
+        the Google Sheet. Rows are keyed by the outbox entry id, so recording a report twice
+        keeps one row.
+
+        Args:
+            path (str): Path to the SQLite file.
+    """
+
+    schema = f"""
+        CREATE TABLE IF NOT EXISTS reports (
+            id TEXT PRIMARY KEY,
+            day TEXT NOT NULL,
+            department TEXT NOT NULL,
+            user_id INTEGER,
+            created_at REAL NOT NULL,
+            {", ".join(f"{field} REAL" for field in NUMERIC_FIELDS)}
+        );
+        CREATE INDEX IF NOT EXISTS reports_summary ON reports (day, department, {", ".join(SUMMARY_FIELDS)});
+    """
+
+    def connect(self):
+        conn = super().connect()
+        # Fields added to the department table after the file was created get their own column
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}
+        for field in NUMERIC_FIELDS:
+            if field not in existing:
+                conn.execute(f"ALTER TABLE reports ADD COLUMN {field} REAL")
+        return conn
+
+    async def append_many(self, reports):
+        """
+            Records finished reports in one transaction, text answers are ignored.
+
+            Args:
+                reports (list): (report_id, department, day, user_data) tuples, where report_id is the
+                    outbox entry id and day the day the report was submitted.
+        """
+        created_at = time.time()
+        rows = [
+            (report_id, day.isoformat(), department, user_data.get("user_id"), created_at,
+             *(user_data.get(field) for field in NUMERIC_FIELDS))
+            for report_id, department, day, user_data in reports
+        ]
+        await self.run(self._append, rows)
+
+    @staticmethod
+    def _append(conn, rows):
+        with transaction(conn):
+            conn.executemany(
+                f"INSERT OR IGNORE INTO reports (id, day, department, user_id, created_at, {', '.join(NUMERIC_FIELDS)}) "
+                f"VALUES (?, ?, ?, ?, ?{', ?' * len(NUMERIC_FIELDS)})",
+                rows
+            )
+
+    async def submitted(self, user_id, first_day, last_day):
+        # (department, day) pairs the user already reported between two days, both included
+        rows = await self.run(lambda conn: conn.execute(
+            "SELECT department, day FROM reports WHERE day BETWEEN ? AND ? AND user_id = ?",
+            (first_day.isoformat(), last_day.isoformat(), user_id)
+        ).fetchall())
+        return {(row["department"], row["day"]) for row in rows}
+
+    async def totals(self, first_day, last_day):
+        """
+            Sums the reports of every department between two days, both included.
+
+            Returns:
+                dict: Department key to a dict with `reports` and the sums of SUMMARY_FIELDS.
+        """
+        rows = await self.run(lambda conn: conn.execute(
+            f"SELECT department, COUNT(*) AS reports, {', '.join(f'SUM({field}) AS {field}' for field in SUMMARY_FIELDS)} "
+            "FROM reports WHERE day BETWEEN ? AND ? GROUP BY department",
+            (first_day.isoformat(), last_day.isoformat())
+        ).fetchall())
+        return {row["department"]: dict(row) for row in rows}
+
+    async def summary(self, day):
+        """
+            Week-to-date and month-to-date totals of every department.
+
+            Args:
+                day (datetime.date): The last day of both periods, usually today.
+
+            Returns:
+                dict: "week" and "month" mapped to (first day, totals as returned by `totals`).
+        """
+        week_start = day - timedelta(days=day.weekday())
+        month_start = day.replace(day=1)
+        return {
+            "week": (week_start, await self.totals(week_start, day)),
+            "month": (month_start, await self.totals(month_start, day))
+        }
+
+
+def format_summary(summary, day):
+    # Text of the /summary reply, plan vs actual only for departments that report a plan
+    lines = []
+    for period, (first_day, totals) in summary.items():
+        lines.append(f"This {period} ({first_day.strftime('%d/%m')} – {day.strftime('%d/%m')}):")
+        for key, department in DEPARTMENTS.items():
+            row = totals.get(key)
+            if row is None:
+                lines.append(f"{department.name}: no reports")
+                continue
+            line = f"{department.name}: {row['reports']} report(s), actual {row['serviced'] or 0:g}"
+            if row["plan"]:
+                line += f" of {row['plan']:g} planned ({(row['serviced'] or 0) / row['plan'] * 100:.0f}%)"
+            if row["worked_hours"] is not None:
+                line += f", {row['worked_hours']:g} h worked"
+            lines.append(line)
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def format_status(status, day):
+    # Text of the /status reply, one line per department
+    lines = [f"Reports for {day.strftime('%d/%m/%Y')}:"]
+    for key, department in DEPARTMENTS.items():
+        row = status.get(key, {})
+        if row.get("reports"):
+            line = f"{department.name}: reported ({row['reports']} report(s)), latest column {row['last_column']}"
+        elif row.get("last_date"):
+            line = f"{department.name}: not reported yet, last report {row['last_date']} in column {row['last_column']}"
+        else:
+            line = f"{department.name}: not reported yet, no earlier reports in the worksheet"
+        lines.append(line)
+    return "\n".join(lines)
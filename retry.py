@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import random
+import time
+
+import google.auth.exceptions
+import gspread
+import requests
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: quota exhaustion and server-side failures
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Errors raised by a failed request: an API error, a connection error or a failed credentials refresh
+REMOTE_ERRORS = (gspread.exceptions.APIError, requests.exceptions.RequestException,
+                 google.auth.exceptions.GoogleAuthError)
+
+
+class CircuitOpenError(Exception):
+    """
+        Raised instead of calling a service whose circuit breaker is open.
+    """
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable, next attempt in {retry_in:.0f} seconds")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+        Stops calling a failing service until it has had time to recover.
+
+        The breaker opens after `failure_threshold` consecutive failures. While it is open
+        every call is refused; after `reset_timeout` seconds it lets a single probe call
+        through (half-open). A successful probe closes the breaker, a failed one opens it
+        again for another `reset_timeout`, and one that ends without an answer (cancelled,
+        unexpected error) lets the next call probe instead.
+
+        Args:
+            name (str): Name of the service, used in logs and errors.
+            failure_threshold (int): Consecutive failures that open the breaker.
+            reset_timeout (float): Seconds the breaker stays open before a probe is allowed.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # Seconds callers wait while the probe is running
+    PROBE_WAIT = 1
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._probe_in_flight = False
+
+    def retry_in(self):
+        # Seconds until a call may be attempted, 0 if one may be attempted now
+        if self.state == self.OPEN:
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+        if self.state == self.HALF_OPEN and self._probe_in_flight:
+            return self.PROBE_WAIT
+        return 0
+
+    def before_call(self):
+        """
+            Checks that a call may be made, moving an expired open breaker to half-open.
+
+            Returns:
+                bool: True if the call is the probe of a half-open breaker.
+
+            Raises:
+                CircuitOpenError: If the breaker is open or a probe is already running.
+        """
+        if self.state == self.OPEN and not self.retry_in():
+            self.state = self.HALF_OPEN
+            logger.info(f"{self.name} circuit half-open, sending a probe")
+
+        if self.state == self.OPEN:
+            raise CircuitOpenError(self.name, self.retry_in())
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.name, self.retry_in())
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        # The probe ended without telling whether the service is healthy, the next call probes again
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"{self.name} circuit open for {self.reset_timeout} seconds after {self.failures} failure(s)")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+# Seconds the server asked us to wait, None if the error carries no Retry-After header
+def retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Check if an error is transient, client errors such as a bad range are not retried
+def is_retryable(error):
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code in RETRYABLE_STATUSES
+    if isinstance(error, google.auth.exceptions.TransportError):
+        # google-auth could not reach the token endpoint
+        return True
+    if isinstance(error, google.auth.exceptions.GoogleAuthError):
+        # e.g. a refresh answered with a temporary server error, not revoked credentials
+        return error.retryable
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+class RetryPolicy:
+    """
+        Retries async calls to a remote service with decorrelated jitter.
+
+        Each delay is drawn from `[base_delay, 3 * previous delay]` and capped at
+        `max_delay`, so concurrent callers spread out instead of retrying in lockstep.
+        A Retry-After header on the error is honored as the minimum delay. Every attempt
+        goes through the circuit breaker: once it opens, calls fail fast with
+        CircuitOpenError instead of adding to the load.
+
+        Args:
+            breaker (CircuitBreaker): The breaker shared by all calls to the service.
+            max_attempts (int): Maximum number of attempts per call.
+            base_delay (float): Smallest delay in seconds between attempts.
+            max_delay (float): Largest delay in seconds between attempts.
+    """
+
+    def __init__(self, breaker, max_attempts=5, base_delay=1, max_delay=60):
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.failures = 0
+
+    def next_delay(self, previous_delay, error=None):
+        delay = min(self.max_delay, random.uniform(self.base_delay, previous_delay * 3))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
+
+    async def call(self, func, *args, **kwargs):
+        """
+            Awaits `func(*args, **kwargs)`, retrying transient failures.
+
+            Returns:
+                The result of the call.
+
+            Raises:
+                CircuitOpenError: If the breaker is open.
+                gspread.exceptions.APIError: If the call fails with a permanent error or after max_attempts.
+                requests.exceptions.RequestException: If a request error occurs after max_attempts.
+                google.auth.exceptions.GoogleAuthError: If the credentials cannot be refreshed.
+        """
+        return await self._call(func, args, kwargs, lookup=False)
+
+    async def lookup(self, func, *args, **kwargs):
+        """
+            Awaits `func(*args, **kwargs)` like `call`, for calls usually answered from a cache.
+
+            A lookup such as opening a cached worksheet may never reach the service, so it is
+            never the probe of a half-open breaker and its success does not close the breaker;
+            its failures still count.
+
+            Returns:
+                The result of the call.
+
+            Raises:
+                CircuitOpenError: If the breaker is open.
+                gspread.exceptions.APIError: If the call fails with a permanent error or after max_attempts.
+                requests.exceptions.RequestException: If a request error occurs after max_attempts.
+                google.auth.exceptions.GoogleAuthError: If the credentials cannot be refreshed.
+        """
+        return await self._call(func, args, kwargs, lookup=True)
+
+    async def _call(self, func, args, kwargs, lookup):
+        delay = self.base_delay
+        for attempt in range(1, self.max_attempts + 1):
+            if lookup:
+                probe = False
+                if self.breaker.state == CircuitBreaker.OPEN and self.breaker.retry_in():
+                    raise CircuitOpenError(self.breaker.name, self.breaker.retry_in())
+            else:
+                probe = self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except REMOTE_ERRORS as e:
+                if not is_retryable(e):
+                    # The service answered, it is healthy even though the request was wrong
+                    if not lookup:
+                        self.breaker.record_success()
+                    self.failures += 1
+                    raise
+                self.breaker.record_failure()
+                if self.breaker.state == CircuitBreaker.OPEN:
+                    self.failures += 1
+                    # This failure tripped the breaker, stop here instead of waiting for the next attempt
+                    raise CircuitOpenError(self.breaker.name, self.breaker.retry_in()) from e
+                if attempt == self.max_attempts:
+                    self.failures += 1
+                    logger.error(f"{self.breaker.name} call failed after {attempt} attempts. Error: {e}")
+                    raise
+
+                delay = self.next_delay(delay, e)
+                self.retries += 1
+                logger.warning(
+                    f"{self.breaker.name} call failed (attempt {attempt}/{self.max_attempts}). "
+                    f"Retrying in {delay:.1f} seconds. Error: {e}")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled or failed before the service answered, a half-open breaker must not wait for it forever
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            else:
+                if not lookup:
+                    self.breaker.record_success()
+                return result
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Priorities of outbound calls, lower is sent first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Bot API methods that count against Telegram's flood limits
+LIMITED_METHOD_PREFIXES = ("send", "edit", "forward", "copy", "delete", "answerCallbackQuery")
+
+_priority = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_priority():
+    # Calls made inside this block (and tasks created in it) are queued behind interactive replies
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+        Classic token bucket: `rate` tokens per second, at most `capacity` stored.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        # Seconds until a token is available, 0 if one is available now
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now):
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class OutboundLimiter:
+    """
+        Grants outbound Bot API calls in priority order while respecting a global token
+        bucket and one bucket per chat (private chats and groups have separate rates).
+
+        Waiters of a higher priority are always considered first; a waiter whose chat is
+        out of tokens does not block waiters for other chats.
+
+        Args:
+            global_rate (float): Calls per second for the whole bot.
+            chat_rate (float): Calls per second to one private chat.
+            group_rate (float): Calls per second to one group chat.
+            burst (int): Calls a chat may receive back to back.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, group_rate=20 / 60, burst=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.chat_buckets = {}
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.retry_after_count = 0
+        self._queues = {priority: deque() for priority in PRIORITY_NAMES}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    async def acquire(self, chat_id, priority=INTERACTIVE):
+        """
+            Waits until a call to `chat_id` may be sent.
+
+            Args:
+                chat_id: The target chat, `None` if the call has no chat.
+                priority (int): INTERACTIVE or BULK.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((chat_id, future))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+
+    def pause(self, chat_id, seconds):
+        # Honor a RetryAfter: hold the chat, or the whole bot when the call had no chat
+        self.retry_after_count += 1
+        bucket = self.global_bucket if chat_id is None else self._chat_bucket(chat_id)
+        bucket.pause(seconds)
+        self._wakeup.set()
+
+    def depth(self):
+        # Number of calls waiting per priority
+        return {PRIORITY_NAMES[priority]: len(queue) for priority, queue in self._queues.items()}
+
+    def _grant(self, now):
+        # Grant every call that may go out now, return seconds until the next grant or None if nothing waits
+        next_delay = None
+        for priority, queue in self._queues.items():
+            waiting = deque()
+            while queue:
+                chat_id, future = queue.popleft()
+                if future.done():
+                    continue
+
+                delay = self.global_bucket.delay(now)
+                if not delay and chat_id is not None:
+                    delay = self._chat_bucket(chat_id).delay(now)
+                if delay:
+                    waiting.append((chat_id, future))
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+                    continue
+
+                self.global_bucket.take(now)
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).take(now)
+                self.granted[priority] += 1
+                future.set_result(None)
+            self._queues[priority] = waiting
+
+        # Forget the buckets of chats that have been quiet for a while
+        if len(self.chat_buckets) > 1000:
+            self.chat_buckets = {chat_id: bucket for chat_id, bucket in self.chat_buckets.items() if not bucket.is_idle(now)}
+        return next_delay
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._grant(time.monotonic())
+            if delay is None:
+                await self._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+
+class ThrottledBot(Bot):
+    """
+        Bot whose API calls go through an OutboundLimiter.
+
+        Every call that counts against Telegram's flood limits waits for the limiter;
+        calls made under `bulk_priority()` wait behind interactive replies and callback
+        answers. A RetryAfter error pauses the chat (or the whole bot) for the time
+        Telegram asks for and the call is retried.
+
+        Args:
+            limiter (OutboundLimiter): The limiter shared by all calls.
+            max_retry_after (int): How many RetryAfter errors a single call may retry.
+    """
+
+    def __init__(self, *args, limiter=None, max_retry_after=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or OutboundLimiter()
+        self.max_retry_after = max_retry_after
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if not method.startswith(LIMITED_METHOD_PREFIXES):
+            return await super().request(method, data, files, **kwargs)
+
+        chat_id = (data or {}).get("chat_id")
+        for attempt in range(self.max_retry_after + 1):
+            await self.limiter.acquire(chat_id, _priority.get())
+            try:
+                return await super().request(method, data, files, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retry_after:
+                    raise
+                logger.warning(f"Flood control on {method} to chat {chat_id}, retrying in {e.timeout} seconds")
+                self.limiter.pause(chat_id, e.timeout)
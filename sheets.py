@@ -0,0 +1,706 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import google.auth.exceptions
+import gspread
+import requests
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from gspread import utils
+
+logger = logging.getLogger(__name__)
+
+# Reports are written from column C onwards
+FIRST_DATA_COLUMN = 3
+
+# Columns added beyond the one a report needs when a worksheet runs out of them
+COLUMN_GROWTH = 50
+
+
+# Convert a column index to its A1 letters (3 -> "C", 28 -> "AB")
+def column_letter(col_index):
+    return utils.rowcol_to_a1(1, col_index)[:-1]
+
+
+# Prepare an answer for a USER_ENTERED write: text stays text instead of being parsed as a formula, number or date
+def cell_value(value):
+    if isinstance(value, str):
+        return f"'{value}"
+    return value
+
+
+# Find the first empty column (from column C) in an already fetched row
+def first_empty_column(row_values, start=FIRST_DATA_COLUMN):
+    for col_index in range(start, len(row_values) + 1):
+        if not row_values[col_index - 1]:
+            return col_index
+    return max(start, len(row_values) + 1)
+
+
+# Finds the next empty column in the specified row, retries are left to the caller's RetryPolicy
+def find_next_empty_column(sheet, row):
+    """
+        Finds the next empty column in the specified row of a Google Sheets spreadsheet.
+
+        The whole row is fetched with a single `row_values` call instead of reading it cell by cell.
+
+        Args:
+            sheet (gspread.models.Sheet): The Google Sheets sheet object.
+            row (int): The row number to search for an empty column.
+
+        Returns:
+            int: The index of the next empty column.
+
+        Raises:
+            gspread.exceptions.APIError: If the API request fails.
+            requests.exceptions.RequestException: If there is a connection error.
+    """
+    return first_empty_column(sheet.row_values(row))
+
+
+def report_updates(questions, start_row, col_index, day, values):
+    """
+        Builds the cell updates that write one report into a department block.
+
+        The date goes into the department's start row, where USER_ENTERED parses it as a
+        date, and every answer into the row and column offset given by its question. Text
+        answers are written as text (see `cell_value`).
+
+        Args:
+            questions (tuple): The department's questions.
+            start_row (int): The department's start row.
+            col_index (int): The report's date column.
+            day (datetime.date): The day of the report.
+            values (dict): The answers by field.
+
+        Returns:
+            list: List of `{'range': ..., 'values': ...}` dictionaries in A1 notation.
+    """
+    updates = [{
+        'range': f"{column_letter(col_index)}{start_row}",
+        'values': [[day.strftime(SheetLayout.DATE_FORMAT)]]
+    }]
+    for question in questions:
+        updates.append({
+            'range': f"{column_letter(col_index + question.shift)}{start_row + question.row}",
+            'values': [[cell_value(values.get(question.field))]]
+        })
+    return updates
+
+
+class SheetClient:
+    """
+        Long-lived cache of the authorized gspread client and the report worksheets.
+
+        The client keeps one pooled keep-alive HTTP session for all requests and the
+        spreadsheet is opened once (by key when one is configured, which skips the Drive
+        lookup by name). Credentials are refreshed ahead of `creds.expiry` by the
+        `keep_credentials_fresh` background task, never inside a report.
+
+        With a `shard_title` format, reports go to one worksheet per period (e.g. one per
+        month) instead of the ever-widening first worksheet. A missing shard is created
+        from the `template_title` worksheet (or, without one, from the first worksheet with
+        its report columns cleared), and the shard of the previous period is archived by
+        protecting it so only the service account can still write to it.
+
+        Args:
+            creds_file (str): Path to the service account credentials file.
+            scopes (list): OAuth scopes to request.
+            spreadsheet_key (str): Optional key of the spreadsheet to open.
+            spreadsheet_title (str): Title used when no key is configured.
+            timeout (float): Timeout in seconds for every request.
+            refresh_margin (float): Seconds before expiry at which credentials are refreshed.
+            shard_title (str): strftime format of the shard titles, e.g. "Report %Y-%m"; empty for a single worksheet.
+            template_title (str): Title of the worksheet new shards are copied from.
+    """
+
+    ARCHIVE_DESCRIPTION = "Archived report shard"
+
+    def __init__(self, creds_file, scopes, spreadsheet_key=None, spreadsheet_title="Report", timeout=60,
+                 refresh_margin=300, shard_title="", template_title="Template"):
+        self.creds_file = creds_file
+        self.scopes = scopes
+        self.spreadsheet_key = spreadsheet_key
+        self.spreadsheet_title = spreadsheet_title
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.shard_title = shard_title
+        self.template_title = template_title
+        self.creds = None
+        self.client = None
+        self._spreadsheet = None
+        self._worksheet = None
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _authorize(self):
+        self.creds = Credentials.from_service_account_file(self.creds_file, scopes=self.scopes)
+        self.client = gspread.authorize(self.creds)
+        self.client.set_timeout(self.timeout)
+        self.refresh_credentials()
+
+    def _open(self):
+        if self._spreadsheet is None:
+            if self.client is None:
+                self._authorize()
+            if self.spreadsheet_key:
+                self._spreadsheet = self.client.open_by_key(self.spreadsheet_key)
+            else:
+                self._spreadsheet = self.client.open(self.spreadsheet_title)
+        return self._spreadsheet
+
+    def spreadsheet(self):
+        # The opened spreadsheet, authorizing on first use
+        with self._lock:
+            return self._open()
+
+    def worksheet(self, day=None):
+        """
+            Returns the cached report worksheet for a day, authorizing and opening the spreadsheet on first use.
+
+            Args:
+                day (datetime.date): The day of the report, today if omitted. Only used with shards.
+
+            Returns:
+                gspread.models.Sheet: The Google Sheets sheet object.
+        """
+        with self._lock:
+            if not self.shard_title:
+                if self._worksheet is None:
+                    self._worksheet = self._open().sheet1
+                return self._worksheet
+
+            title = (day or datetime.now().date()).strftime(self.shard_title)
+            if title not in self._shards:
+                self._shards[title] = self._open_shard(title, day)
+            return self._shards[title]
+
+    def _open_shard(self, title, day):
+        spreadsheet = self._open()
+        try:
+            return spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            pass
+
+        try:
+            template = spreadsheet.worksheet(self.template_title)
+            clear = False
+        except gspread.exceptions.WorksheetNotFound:
+            template, clear = spreadsheet.sheet1, True
+
+        # New shards go first so the current period opens by default
+        shard = spreadsheet.duplicate_sheet(template.id, insert_sheet_index=0, new_sheet_name=title)
+        if clear:
+            shard.batch_clear([f"{column_letter(FIRST_DATA_COLUMN)}1:{column_letter(shard.col_count)}{shard.row_count}"])
+        logger.info(f"Created report shard {title!r} from {template.title!r}")
+
+        previous = (day or datetime.now().date()).replace(day=1) - timedelta(days=1)
+        self._archive(previous.strftime(self.shard_title))
+        return shard
+
+    def ensure_columns(self, sheet, last_column):
+        """
+            Widens the worksheet so that its grid reaches `last_column`.
+
+            A shard starts with the template's column count (26 for a new sheet) and Google
+            rejects writes past the grid, so the sheet grows by COLUMN_GROWTH spare columns
+            whenever a report's cells would not fit.
+
+            Args:
+                sheet (gspread.models.Sheet): The worksheet the report goes to.
+                last_column (int): The rightmost column the report writes.
+        """
+        with self._lock:
+            if last_column <= sheet.col_count:
+                return
+            sheet.add_cols(last_column - sheet.col_count + COLUMN_GROWTH)
+            logger.info(f"Widened {sheet.title!r} to {sheet.col_count} columns")
+
+    def _archive(self, title):
+        # Protect a finished shard so that only the service account can still write late reports to it
+        try:
+            shard = self._spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            return
+        if any(protected.get("description") == self.ARCHIVE_DESCRIPTION
+               for protected in self._spreadsheet.list_protected_ranges(shard.id)):
+            return
+
+        self._spreadsheet.batch_update({"requests": [{"addProtectedRange": {"protectedRange": {
+            "range": {"sheetId": shard.id},
+            "description": self.ARCHIVE_DESCRIPTION,
+            "warningOnly": False,
+            "editors": {"users": [self.creds.service_account_email]}
+        }}}]})
+        logger.info(f"Archived report shard {title!r} as read-only")
+
+    def refresh_credentials(self):
+        # Fetch a new access token over the client's pooled session
+        self.creds.refresh(Request(self.client.http_client.session))
+        logger.info(f"Google credentials refreshed, valid until {self.creds.expiry}")
+
+    def seconds_until_refresh(self):
+        if self.creds is None or self.creds.expiry is None:
+            return 0
+        # google-auth keeps expiry as a naive UTC datetime
+        return (self.creds.expiry - datetime.utcnow()).total_seconds() - self.refresh_margin
+
+    async def keep_credentials_fresh(self, writer, retry_delay=30):
+        """
+            Background task that refreshes the credentials shortly before they expire.
+
+            Args:
+                writer (SheetWriter): Writer used to run the refresh off the event loop.
+                retry_delay (float): Seconds to wait before retrying a failed refresh.
+        """
+        while True:
+            if self.client is not None:
+                await asyncio.sleep(max(self.seconds_until_refresh(), 0))
+            try:
+                if self.client is None:
+                    await writer.run(self.worksheet)
+                else:
+                    await writer.run(self.refresh_credentials)
+            except (gspread.exceptions.GSpreadException, requests.exceptions.RequestException,
+                    google.auth.exceptions.GoogleAuthError) as e:
+                logger.warning(f"Failed to refresh Google credentials, retrying in {retry_delay} seconds. Error: {e}")
+                await asyncio.sleep(retry_delay)
+
+class ColumnCursorIndex:
+    """
+        Keeps the next empty column of every department's start row in memory.
+
+        The cursors are filled by one batched read of all start rows and are advanced
+        in memory after each successful write, so picking a column for a report costs
+        no API calls. A department's row is re-read only when its cursor is invalidated
+        (e.g. after a failed write) or is older than `max_age` seconds. Cursors are kept
+        per worksheet, so reports routed to different shards never share a column.
+
+        Args:
+            start_rows (dict): Mapping of department to its starting row.
+            max_age (float): Seconds after which a cursor is considered stale.
+    """
+
+    def __init__(self, start_rows, max_age=900):
+        self.start_rows = dict(start_rows)
+        self.max_age = max_age
+        self._cursors = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def load(self, sheet):
+        """
+            Fills the cursors of all departments with one `batch_get` request.
+
+            Args:
+                sheet (gspread.models.Sheet): The Google Sheets sheet object.
+
+            Returns:
+                dict: Mapping of department to its next empty column.
+        """
+        return self.fill(sheet, sheet.batch_get(self.ranges()))
+
+    def ranges(self):
+        # The start row of every department, in the order `fill` expects them
+        return [f"{row}:{row}" for row in self.start_rows.values()]
+
+    def fill(self, sheet, value_ranges):
+        """
+            Sets the cursors of a worksheet from already fetched start rows.
+
+            Args:
+                sheet (gspread.models.Sheet): The worksheet the rows were read from.
+                value_ranges (list): The values of the ranges returned by `ranges`, in the same order.
+
+            Returns:
+                dict: Mapping of department to its next empty column.
+        """
+        loaded_at = time.monotonic()
+        with self._lock:
+            for department, values in zip(self.start_rows, value_ranges):
+                self._cursors[sheet.title, department] = first_empty_column(values[0] if values else [])
+                self._loaded_at[sheet.title, department] = loaded_at
+            return {department: self._cursors[sheet.title, department] for department in self.start_rows}
+
+    def is_stale(self, key):
+        loaded_at = self._loaded_at.get(key)
+        return loaded_at is None or time.monotonic() - loaded_at > self.max_age
+
+    def next_column(self, sheet, department):
+        """
+            Returns the next empty column for the department, re-reading its row only if the cursor is stale.
+
+            Args:
+                sheet (gspread.models.Sheet): The Google Sheets sheet object.
+                department (str): The department to look up.
+
+            Returns:
+                int: The index of the next empty column.
+        """
+        key = (sheet.title, department)
+        with self._lock:
+            if not self.is_stale(key):
+                return self._cursors[key]
+
+        col_index = find_next_empty_column(sheet, self.start_rows[department])
+        with self._lock:
+            self._cursors[key] = col_index
+            self._loaded_at[key] = time.monotonic()
+        return col_index
+
+    def advance(self, sheet, department, col_index):
+        # Move the cursor past a column that has just been written
+        key = (sheet.title, department)
+        with self._lock:
+            if key in self._cursors:
+                self._cursors[key] = max(self._cursors[key], col_index + 1)
+
+    def invalidate(self, department=None):
+        # Force the next lookup to re-read the sheet, in every shard
+        with self._lock:
+            for key in list(self._loaded_at):
+                if department is None or key[1] == department:
+                    del self._loaded_at[key]
+
+
+class ReportStatusCache:
+    """
+        Read-through cache of today's reports: how many each department has and its latest column.
+
+        It is filled from the department start rows, by the startup warm-up read or by one
+        `batch_get` on a miss, and answers every lookup from memory until the day rolls over,
+        a committed write invalidates it or it is older than `max_age` seconds (reports
+        written by other processes only show up then).
+
+        Args:
+            start_rows (dict): Mapping of department to its starting row.
+            max_age (float): Seconds after which the cache is considered stale.
+    """
+
+    def __init__(self, start_rows, max_age=300):
+        self.start_rows = dict(start_rows)
+        self.max_age = max_age
+        self._day = None
+        self._status = None
+        self._loaded_at = None
+
+    def ranges(self):
+        # The start row of every department, the same ranges the column cursors read
+        return [f"{row}:{row}" for row in self.start_rows.values()]
+
+    def load(self, sheet, day, cursors=None):
+        """
+            Refreshes the cache with one `batch_get` request.
+
+            Args:
+                sheet (gspread.models.Sheet): The worksheet of `day`.
+                day (datetime.date): The current day.
+                cursors (ColumnCursorIndex): Optional cursors refreshed from the same rows.
+
+            Returns:
+                dict: The status of every department, as returned by `get`.
+        """
+        value_ranges = sheet.batch_get(self.ranges())
+        if cursors is not None:
+            cursors.fill(sheet, value_ranges)
+        return self.fill(day, value_ranges)
+
+    def fill(self, day, value_ranges):
+        """
+            Sets the cache from already fetched start rows.
+
+            Args:
+                day (datetime.date): The day the rows were read on.
+                value_ranges (list): The values of the ranges returned by `ranges`, in the same order.
+
+            Returns:
+                dict: The status of every department, as returned by `get`.
+        """
+        date = day.strftime(SheetLayout.DATE_FORMAT)
+        status = {}
+        for department, values in zip(self.start_rows, value_ranges):
+            row = values[0] if values else []
+            last_column = first_empty_column(row) - 1
+            status[department] = {
+                "reports": row[FIRST_DATA_COLUMN - 1:].count(date),
+                "last_column": column_letter(last_column) if last_column >= FIRST_DATA_COLUMN else None,
+                "last_date": row[last_column - 1] if last_column >= FIRST_DATA_COLUMN else None
+            }
+        self._day = day
+        self._status = status
+        self._loaded_at = time.monotonic()
+        return status
+
+    def get(self, day):
+        """
+            Returns the cached status of `day`.
+
+            Args:
+                day (datetime.date): The current day.
+
+            Returns:
+                dict: Mapping of department to its `reports` today, `last_column` (A1 letters) and
+                `last_date` (both None for an empty row), or None on a miss.
+        """
+        if self._status is None or day != self._day or time.monotonic() - self._loaded_at > self.max_age:
+            return None
+        return self._status
+
+    def invalidate(self):
+        # A report was written, the next lookup re-reads the sheet
+        self._status = None
+
+
+class SheetLayout:
+    """
+        Cached layout of the report worksheet: the row labels of every department block.
+
+        The labels are read once at startup (columns A-B, next to the answers) and checked
+        against the department field map, so a block that was moved or shortened in the
+        sheet is reported in the log instead of answers silently landing next to the
+        wrong labels.
+
+        Args:
+            departments (dict): Mapping of department key to its Department entry.
+    """
+
+    # Report dates are written as dd/mm/YYYY
+    DATE_FORMAT = "%d/%m/%Y"
+
+    def __init__(self, departments):
+        self.departments = departments
+        self.labels = {}
+        self.problems = []
+
+    @staticmethod
+    def last_row(department):
+        return department.start_row + max(question.row for question in department.questions)
+
+    def ranges(self):
+        # The label columns of every department block, in the order `fill` expects them
+        return [f"A{department.start_row}:B{self.last_row(department)}" for department in self.departments.values()]
+
+    def fill(self, value_ranges):
+        # Store the label of every row of every department block
+        for department, rows in zip(self.departments.values(), value_ranges):
+            self.labels[department.key] = {
+                department.start_row + offset: next((cell for cell in row if cell), "")
+                for offset, row in enumerate(rows)
+            }
+
+    def validate(self, start_rows=None):
+        """
+            Checks the cached layout against the department field map.
+
+            Args:
+                start_rows (list): Optional fetched start row of every department, in the order of
+                    `departments`, whose cells from column C must be report dates.
+
+            Returns:
+                list: Descriptions of the problems found, empty if the layout matches.
+        """
+        problems = []
+        departments = sorted(self.departments.values(), key=lambda department: department.start_row)
+        for department, next_department in zip(departments, departments[1:]):
+            if self.last_row(department) >= next_department.start_row:
+                problems.append(f"{department.key} block (rows {department.start_row}-{self.last_row(department)}) "
+                                f"overlaps {next_department.key} starting at row {next_department.start_row}")
+
+        for department in departments:
+            cells = {}
+            labels = self.labels.get(department.key, {})
+            for question in department.questions:
+                row = department.start_row + question.row
+                if (row, question.shift) in cells:
+                    problems.append(f"{department.key}: {question.field} and {cells[row, question.shift]} "
+                                    f"are written to the same cell in row {row}")
+                cells[row, question.shift] = question.field
+                if department.key in self.labels and not labels.get(row):
+                    problems.append(f"{department.key}: row {row} ({question.field}) has no label in columns A-B")
+
+        for department, values in zip(self.departments.values(), start_rows or ()):
+            row = values[0] if values else []
+            for col_index in range(FIRST_DATA_COLUMN, len(row) + 1):
+                value = row[col_index - 1]
+                try:
+                    if value:
+                        datetime.strptime(value, self.DATE_FORMAT)
+                except ValueError:
+                    problems.append(f"{department.key}: {column_letter(col_index)}{department.start_row} "
+                                    f"holds {value!r} instead of a report date")
+                    break
+
+        self.problems = problems
+        return problems
+
+
+def warm_up(sheet, cursors, layout, status=None, day=None):
+    """
+        Reads every department's start row and label columns with one `batch_get` request,
+        fills the column cursors, the layout cache and the status cache and validates the layout.
+
+        Args:
+            sheet (gspread.models.Sheet): The Google Sheets sheet object.
+            cursors (ColumnCursorIndex): The cursors to fill.
+            layout (SheetLayout): The layout cache to fill.
+            status (ReportStatusCache): Optional status cache to fill for `day`.
+            day (datetime.date): The day of `sheet`, required with `status`.
+
+        Returns:
+            list: The layout problems found, empty if the sheet matches the department field map.
+    """
+    cursor_ranges = cursors.ranges()
+    value_ranges = sheet.batch_get(cursor_ranges + layout.ranges())
+    start_rows = value_ranges[:len(cursor_ranges)]
+    cursors.fill(sheet, start_rows)
+    if status is not None:
+        status.fill(day, start_rows)
+    layout.fill(value_ranges[len(cursor_ranges):])
+    return layout.validate(start_rows)
+
+
+class SheetWriter:
+    """
+        Runs blocking gspread calls on a thread pool so that no Google request or retry
+        delay ever runs on the event loop.
+
+        Args:
+            executor (concurrent.futures.Executor): The pool the calls are run on.
+            max_in_flight (int): Maximum number of calls running at the same time.
+            call_latency (metrics.Histogram): Optional histogram observing every call by operation and outcome.
+    """
+
+    def __init__(self, executor, max_in_flight=5, call_latency=None):
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.call_latency = call_latency
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(self, func, *args, **kwargs):
+        """
+            Calls `func(*args, **kwargs)` on the pool, waiting for a free slot first.
+
+            Returns:
+                The return value of `func`.
+        """
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+                outcome = "ok"
+                return result
+            finally:
+                self.in_flight -= 1
+                if self.call_latency is not None:
+                    operation = getattr(func, "__name__", type(func).__name__)
+                    self.call_latency.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+
+
+class WriteBehindBuffer:
+    """
+        Coalesces the cell updates of reports finished within a short window into a single
+        `values_batch_update` request per spreadsheet.
+
+        Every submitted report gets its own future, which is resolved or failed together
+        with the flush that carried its updates. Retries and circuit breaker accounting apply
+        to each request, so a failed flush counts once however many reports it carried.
+
+        Args:
+            writer (SheetWriter): Writer used to run the request off the event loop.
+            retry (retry.RetryPolicy): Policy the requests are sent through.
+            flush_interval (float): Seconds to wait for more reports after the first one arrives.
+            max_batch_size (int): Maximum number of reports sent in one flush.
+    """
+
+    def __init__(self, writer, retry, flush_interval=0.5, max_batch_size=50):
+        self.writer = writer
+        self.retry = retry
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, sheet, updates):
+        """
+            Queues the updates of one report.
+
+            Args:
+                sheet (gspread.models.Sheet): The worksheet the ranges belong to.
+                updates (list): List of `{'range': ..., 'values': ...}` dictionaries in A1 notation.
+
+            Returns:
+                asyncio.Future: Resolved when the updates are written, failed with the API error or
+                    CircuitOpenError otherwise.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((sheet, updates, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._start_flush)
+        return future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+        # Anything left over goes out with the next flush
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    async def _flush(self, batch):
+        # Group the reports by spreadsheet, one request per spreadsheet
+        groups = {}
+        for sheet, updates, future in batch:
+            spreadsheet, data, futures = groups.setdefault(sheet.spreadsheet.id, (sheet.spreadsheet, [], []))
+            data.extend({
+                'range': utils.absolute_range_name(sheet.title, update['range']),
+                'values': update['values']
+            } for update in updates)
+            futures.append(future)
+
+        for spreadsheet, data, futures in groups.values():
+            try:
+                await self.retry.call(self.writer.run, spreadsheet.values_batch_update,
+                                      {"valueInputOption": "USER_ENTERED", "data": data})
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(len(data))
+            finally:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+
+        logger.info(f"Flushed {len(batch)} report(s) to Google Sheets in {len(groups)} request(s)")
+
+    async def flush(self):
+        # Send everything that is still buffered and wait for it
+        while self._pending:
+            self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
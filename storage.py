@@ -0,0 +1,395 @@
+import json
+import logging
+import sys
+import time
+import typing
+from urllib.parse import urlparse
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class FSMDatabase(SQLiteDatabase):
+    schema = """
+        CREATE TABLE IF NOT EXISTS fsm (
+            chat TEXT NOT NULL,
+            user TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            bucket TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (chat, user)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at);
+    """
+
+
+class SQLiteStorage(BaseStorage):
+    """
+        FSM storage kept in a local SQLite file.
+
+        Every (chat, user) pair is one row looked up by its primary key. `update_data`
+        merges the new fields into the stored data with a single `json_patch` statement
+        instead of a read-modify-write round trip. Sessions that were not touched for
+        `ttl` seconds are treated as empty and are removed by `purge_expired`. The file
+        runs in WAL mode, so several bot processes on the same host can share it.
+
+        Args:
+            path (str): Path to the SQLite file.
+            ttl (float): Seconds after which an untouched session expires, `None` to keep sessions forever.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.db = FSMDatabase(path)
+        self.ttl = ttl
+
+    def _cutoff(self):
+        return time.time() - self.ttl if self.ttl else 0
+
+    async def close(self):
+        self.db.close()
+
+    async def wait_closed(self):
+        pass
+
+    async def _get(self, column, chat, user):
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        row = await self.db.run(lambda conn: conn.execute(
+            f"SELECT {column} FROM fsm WHERE chat = ? AND user = ? AND updated_at >= ?",
+            (chat, user, self._cutoff())
+        ).fetchone())
+        return row[0] if row else None
+
+    async def _upsert(self, chat, user, state=None, data=None, bucket=None, merge=False):
+        # One statement per write: unchanged columns are kept, columns of an expired session are reset
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        keep = "CASE WHEN fsm.updated_at < :cutoff THEN {empty} ELSE fsm.{column} END"
+        merged = "CASE WHEN fsm.updated_at < :cutoff THEN excluded.{column} ELSE json_patch(fsm.{column}, excluded.{column}) END"
+        assignments = []
+        for column, value, empty in (("state", state, "NULL"), ("data", data, "'{}'"), ("bucket", bucket, "'{}'")):
+            if value is None:
+                assignments.append(f"{column} = " + keep.format(empty=empty, column=column))
+            elif merge and column != "state":
+                assignments.append(f"{column} = " + merged.format(column=column))
+            else:
+                assignments.append(f"{column} = excluded.{column}")
+
+        params = {
+            "chat": chat,
+            "user": user,
+            "state": state if state is not ... else None,
+            "data": json.dumps(data) if data is not None else "{}",
+            "bucket": json.dumps(bucket) if bucket is not None else "{}",
+            "now": time.time(),
+            "cutoff": self._cutoff()
+        }
+        sql = (
+            "INSERT INTO fsm (chat, user, state, data, bucket, updated_at) "
+            "VALUES (:chat, :user, :state, :data, :bucket, :now) "
+            f"ON CONFLICT (chat, user) DO UPDATE SET {', '.join(assignments)}, updated_at = excluded.updated_at"
+        )
+        await self.db.run(lambda conn: conn.execute(sql, params))
+
+    async def get_state(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        state = await self._get("state", chat, user)
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[typing.Dict] = None) -> typing.Dict:
+        data = await self._get("data", chat, user)
+        return json.loads(data) if data is not None else dict(default or {})
+
+    async def set_state(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        # `...` marks an explicit reset of the state, `None` means "keep the stored value" in _upsert
+        state = self.resolve_state(state)
+        await self._upsert(chat, user, state=state if state is not None else ...)
+
+    async def set_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        await self._upsert(chat, user, data=dict(data or {}))
+
+    async def update_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        # Note: json_patch drops keys whose new value is None
+        data = dict(data or {}, **kwargs)
+        await self._upsert(chat, user, data=data, merge=True)
+
+    async def reset_state(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+
+        def reset(conn):
+            if with_data:
+                conn.execute("UPDATE fsm SET state = NULL, data = '{}' WHERE chat = ? AND user = ?", (chat, user))
+            else:
+                conn.execute("UPDATE fsm SET state = NULL WHERE chat = ? AND user = ?", (chat, user))
+            # Finished sessions without a bucket are removed completely
+            conn.execute(
+                "DELETE FROM fsm WHERE chat = ? AND user = ? AND state IS NULL AND data = '{}' AND bucket = '{}'",
+                (chat, user)
+            )
+
+        await self.db.run(reset)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        bucket = await self._get("bucket", chat, user)
+        return json.loads(bucket) if bucket is not None else dict(default or {})
+
+    async def set_bucket(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        await self._upsert(chat, user, bucket=dict(bucket or {}))
+
+    async def update_bucket(self, *, chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        bucket = dict(bucket or {}, **kwargs)
+        await self._upsert(chat, user, bucket=bucket, merge=True)
+
+    async def purge_expired(self):
+        """
+            Removes sessions that were not touched for longer than the TTL.
+
+            Every removed session is returned by exactly one call, also when several bot
+            processes share the file, so its user is notified once.
+
+            Returns:
+                list: The (chat, user, state) of every removed session.
+        """
+        if not self.ttl:
+            return []
+        cutoff = self._cutoff()
+        rows = await self.db.run(lambda conn: conn.execute(
+            "DELETE FROM fsm WHERE updated_at < ? RETURNING chat, user, state", (cutoff,)
+        ).fetchall())
+        return [(int(chat), int(user), state) for chat, user, state in rows]
+
+    async def count_active(self):
+        # Number of unexpired sessions that are in the middle of a conversation
+        cutoff = self._cutoff()
+        return await self.db.run(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM fsm WHERE state IS NOT NULL AND updated_at >= ?", (cutoff,)
+        ).fetchone()[0])
+
+    async def session_bytes(self):
+        # Total and largest size of the stored session data
+        cutoff = self._cutoff()
+        total, largest = await self.db.run(lambda conn: conn.execute(
+            "SELECT COALESCE(SUM(length(data) + length(bucket)), 0), COALESCE(MAX(length(data) + length(bucket)), 0) "
+            "FROM fsm WHERE updated_at >= ?", (cutoff,)
+        ).fetchone())
+        return {"total": total, "max": largest}
+
+
+# Marks an unset field of a session
+_MISSING = object()
+
+
+class Session:
+    """
+        One conversation kept by CompactMemoryStorage.
+
+        The data keys known up front (the report answers) sit at fixed positions of the
+        `values` list instead of in a dict per session; any other key goes to `extra`.
+    """
+
+    __slots__ = ("state", "values", "extra", "bucket", "updated_at")
+
+    def __init__(self, size):
+        self.state = None
+        self.values = [_MISSING] * size
+        self.extra = None
+        self.bucket = None
+        self.updated_at = time.monotonic()
+
+    def is_empty(self):
+        return self.state is None and not self.extra and not self.bucket and all(
+            value is _MISSING for value in self.values
+        )
+
+    def size(self):
+        # Approximate bytes held by the session and its values
+        size = sys.getsizeof(self) + sys.getsizeof(self.values)
+        size += sum(sys.getsizeof(value) for value in self.values if value is not _MISSING)
+        for mapping in (self.extra, self.bucket):
+            if mapping:
+                size += sys.getsizeof(mapping) + sum(map(sys.getsizeof, mapping.values()))
+        return size
+
+
+class CompactMemoryStorage(BaseStorage):
+    """
+        FSM storage kept in process memory with compact, expiring sessions.
+
+        Unlike aiogram's MemoryStorage, which keeps a state and a data dict for every user
+        who ever wrote to the bot, a session here is a slotted record with the report
+        answers at fixed positions and it is removed as soon as the conversation finishes.
+        Sessions that were not touched for `ttl` seconds are treated as empty and are
+        removed by `purge_expired`. With answers bounded by the departments' validators
+        every session stays within a few kilobytes.
+
+        Args:
+            fields (iterable): Data keys stored at fixed positions, e.g. the report fields.
+            ttl (float): Seconds after which an untouched session expires, `None` to keep sessions forever.
+    """
+
+    def __init__(self, fields=(), ttl=None):
+        self.fields = tuple(fields)
+        self.positions = {field: position for position, field in enumerate(self.fields)}
+        self.ttl = ttl
+        self.sessions = {}
+
+    async def close(self):
+        self.sessions.clear()
+
+    async def wait_closed(self):
+        pass
+
+    def _expired(self, session, now=None):
+        return bool(self.ttl) and (now or time.monotonic()) - session.updated_at > self.ttl
+
+    def _get(self, chat, user):
+        session = self.sessions.get(self.check_address(chat=chat, user=user))
+        return None if session is None or self._expired(session) else session
+
+    def _write(self, chat, user, write):
+        # Apply a change to the session, starting a new one if it is missing or expired
+        key = self.check_address(chat=chat, user=user)
+        session = self.sessions.get(key)
+        if session is None or self._expired(session):
+            session = self.sessions[key] = Session(len(self.fields))
+        write(session)
+        session.updated_at = time.monotonic()
+        # Finished sessions are removed completely
+        if session.is_empty():
+            del self.sessions[key]
+
+    def _data(self, session):
+        data = {field: value for field, value in zip(self.fields, session.values) if value is not _MISSING}
+        if session.extra:
+            data.update(session.extra)
+        return data
+
+    def _update(self, session, data):
+        for key, value in data.items():
+            position = self.positions.get(key)
+            if position is not None:
+                session.values[position] = value
+            else:
+                if session.extra is None:
+                    session.extra = {}
+                session.extra[key] = value
+
+    def _replace(self, session, data):
+        session.values = [_MISSING] * len(self.fields)
+        session.extra = None
+        self._update(session, data)
+
+    async def get_state(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        session = self._get(chat, user)
+        return session.state if session is not None and session.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[typing.Dict] = None) -> typing.Dict:
+        session = self._get(chat, user)
+        return self._data(session) if session is not None else dict(default or {})
+
+    async def set_state(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        state = self.resolve_state(state)
+        self._write(chat, user, lambda session: setattr(session, "state", state))
+
+    async def set_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        self._write(chat, user, lambda session: self._replace(session, data or {}))
+
+    async def update_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        data = dict(data or {}, **kwargs)
+        self._write(chat, user, lambda session: self._update(session, data))
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        session = self._get(chat, user)
+        return dict(session.bucket) if session is not None and session.bucket else dict(default or {})
+
+    async def set_bucket(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        bucket = dict(bucket or {})
+        self._write(chat, user, lambda session: setattr(session, "bucket", bucket))
+
+    async def update_bucket(self, *, chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        bucket = dict(bucket or {}, **kwargs)
+        self._write(chat, user, lambda session: setattr(session, "bucket", dict(session.bucket or {}, **bucket)))
+
+    async def purge_expired(self):
+        """
+            Removes sessions that were not touched for longer than the TTL.
+
+            Returns:
+                list: The (chat, user, state) of every removed session.
+        """
+        if not self.ttl:
+            return []
+        now = time.monotonic()
+        expired = [key for key, session in self.sessions.items() if self._expired(session, now)]
+        return [(chat, user, self.sessions.pop((chat, user)).state) for chat, user in expired]
+
+    async def count_active(self):
+        # Number of unexpired sessions that are in the middle of a conversation
+        now = time.monotonic()
+        return sum(1 for session in self.sessions.values() if session.state is not None and not self._expired(session, now))
+
+    async def session_bytes(self):
+        # Total and largest approximate size of the sessions in memory
+        sizes = [session.size() for session in self.sessions.values()]
+        return {"total": sum(sizes), "max": max(sizes, default=0)}
+
+
+def create_storage(url, ttl=None, fields=()):
+    """
+        Builds the FSM storage described by a URL.
+
+        Supported values are `memory://`, `sqlite:///path/to/file` and `redis://host:port/db`.
+        The Redis backend needs the optional `aioredis` package (used by aiogram's RedisStorage2).
+
+        Args:
+            url (str): The storage URL.
+            ttl (int): Seconds after which an abandoned session expires.
+            fields (iterable): Data keys the in-memory storage keeps at fixed positions.
+
+        Returns:
+            BaseStorage: The storage instance.
+    """
+    parsed = urlparse(url)
+
+    if parsed.scheme == "memory":
+        return CompactMemoryStorage(fields, ttl=ttl)
+    if parsed.scheme == "sqlite":
+        return SQLiteStorage(parsed.path[1:] or "fsm.sqlite3", ttl=ttl)
+    if parsed.scheme == "redis":
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+        return RedisStorage2(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            state_ttl=ttl,
+            data_ttl=ttl
+        )
+    raise ValueError(f"Unsupported FSM storage: {url}")
@@ -0,0 +1,249 @@
+"""
+    Multi-process runtime of the bot.
+
+    The supervisor long-polls Telegram and hands every update to one of N worker processes,
+    chosen by the update's chat, so all updates of a conversation are handled by the same
+    worker in the order they arrived. Each worker runs the full bot (`main.create_app`) on
+    the shared SQLite files: FSM sessions, outbox, ledger, reminders and column
+    reservations. The workers compete for a leader lease and only the leader writes the
+    outbox to Google Sheets and runs the scheduler. A worker that dies is restarted on a
+    fresh queue; updates it had not handled yet are lost, like those in flight when a
+    single-process bot crashes.
+
+    Usage:
+        BOT_MODE=supervisor BOT_WORKERS=4 python main.py
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils.exceptions import NetworkError, TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+# Update fields that carry a message, the chat comes from the message
+MESSAGE_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+
+def chat_id_of(update):
+    """
+        Returns the chat an update belongs to, the user for updates without a chat.
+
+        Args:
+            update (dict): The update as received from Telegram.
+
+        Returns:
+            int: The chat id, 0 if the update names neither a chat nor a user.
+    """
+    for field in MESSAGE_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+    callback_query = update.get("callback_query")
+    if callback_query is not None:
+        # The FSM state of a button press belongs to the chat of the message with the button
+        message = callback_query.get("message")
+        return message["chat"]["id"] if message else callback_query["from"]["id"]
+    for value in update.values():
+        if isinstance(value, dict):
+            if "chat" in value:
+                return value["chat"]["id"]
+            if "from" in value:
+                return value["from"]["id"]
+    return 0
+
+
+# Index of the worker that handles a chat, the same for the chat's whole life
+def route(update, workers):
+    return abs(chat_id_of(update)) % workers
+
+
+def run_worker(index, workers, updates):
+    """
+        Entry point of a worker process: runs the bot on the updates from its queue.
+
+        Args:
+            index (int): Position of the worker.
+            workers (int): Number of workers.
+            updates (multiprocessing.Queue): Lists of raw updates, None to stop.
+    """
+    # Ctrl+C reaches the whole process group, the supervisor stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # Every worker serves its own metrics port and gets its share of the global Telegram rate
+    metrics_port = int(os.getenv("METRICS_PORT", 9100))
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(metrics_port + index + 1)
+    os.environ["TELEGRAM_GLOBAL_RATE"] = str(float(os.getenv("TELEGRAM_GLOBAL_RATE", 30)) / workers)
+
+    import main
+
+    dp = main.create_app(worker_name=f"worker-{index}-{os.getpid()}")
+    asyncio.run(serve(main, dp, updates))
+
+
+async def process_chat(dp, previous, updates):
+    # Handle the updates of one chat one at a time, after the chat's earlier batches
+    if previous is not None:
+        await asyncio.wait({previous})
+    for update in updates:
+        try:
+            await dp.process_updates([types.Update(**update)])
+        except Exception:
+            logger.exception(f"Failed to process update {update.get('update_id')}")
+
+
+async def serve(main, dp, updates):
+    # Process the batches of the queue without waiting for them, the chats of a batch concurrently
+    # and the updates of one chat in the order they arrived
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    await main.on_startup(dp)
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    # Task handling the latest updates of every chat that has some in progress
+    chats = {}
+
+    def forget(chat, task):
+        tasks.discard(task)
+        if chats.get(chat) is task:
+            del chats[chat]
+
+    try:
+        while True:
+            batch = await loop.run_in_executor(None, updates.get)
+            if batch is None:
+                break
+            by_chat = {}
+            for update in batch:
+                by_chat.setdefault(chat_id_of(update), []).append(update)
+            for chat, chat_updates in by_chat.items():
+                task = asyncio.create_task(process_chat(dp, chats.get(chat), chat_updates))
+                chats[chat] = task
+                tasks.add(task)
+                task.add_done_callback(lambda task, chat=chat: forget(chat, task))
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await main.on_shutdown(dp)
+        await (await dp.bot.get_session()).close()
+
+
+class Supervisor:
+    """
+        Starts the worker processes, restarts the ones that die and routes updates to them.
+
+        Args:
+            workers (int): Number of worker processes.
+            poll_timeout (int): Seconds of one getUpdates long poll.
+    """
+
+    def __init__(self, workers, poll_timeout=20):
+        self.workers = workers
+        self.poll_timeout = poll_timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.queues = [self.context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.stopping = False
+
+    def start_worker(self, index):
+        process = self.context.Process(
+            target=run_worker, args=(index, self.workers, self.queues[index]), name=f"bot-worker-{index}", daemon=False
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def check_workers(self):
+        # Start the missing workers and restart the crashed ones
+        for index, process in enumerate(self.processes):
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.error(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting it")
+                    # A process killed inside get() leaves the queue's lock taken, the new worker gets its own queue
+                    self.queues[index] = self.context.Queue()
+                self.start_worker(index)
+
+    async def poll(self, bot):
+        """
+            Long-polls Telegram and puts every batch of updates on the queues of their workers.
+
+            Updates sent while the bot was down are skipped, like `executor.start_polling(skip_updates=True)`.
+        """
+        skipped = await bot.get_updates(offset=-1, timeout=1)
+        offset = skipped[-1].update_id + 1 if skipped else None
+
+        self.check_workers()
+        while not self.stopping:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=self.poll_timeout)
+            except (NetworkError, TelegramAPIError) as e:
+                logger.warning(f"Failed to get updates, retrying in 5 seconds. Error: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            # Restart dead workers before routing, so no batch goes to the queue of a dead one
+            self.check_workers()
+            batches = [[] for _ in range(self.workers)]
+            for update in updates:
+                data = update.to_python()
+                batches[route(data, self.workers)].append(data)
+                offset = update.update_id + 1
+            for queue, batch in zip(self.queues, batches):
+                if batch:
+                    queue.put(batch)
+
+    def stop(self, timeout=30):
+        # Let every worker finish its queue and shut down cleanly, kill the ones that do not
+        self.stopping = True
+        for queue in self.queues:
+            queue.put(None)
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in {timeout} seconds, terminating it")
+                process.terminate()
+
+
+def run_supervisor(workers):
+    """
+        Runs the bot as a supervisor with `workers` worker processes until interrupted.
+
+        Args:
+            workers (int): Number of worker processes.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    supervisor = Supervisor(workers)
+
+    async def poll():
+        # This bot only receives updates, the workers send every reply
+        bot = Bot(
+            token=os.getenv("TOKEN"),
+            server=TelegramAPIServer.from_base(os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"))
+        )
+        try:
+            await supervisor.poll(bot)
+        finally:
+            await (await bot.get_session()).close()
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(poll())
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, task.cancel)
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        logger.info("Stopping the workers")
+        supervisor.stop(timeout=float(os.getenv("WORKER_STOP_TIMEOUT", 30)))
+        loop.close()
@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+
+import gspread
+import requests
+
+# The bot's modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def api_error(status, retry_after=None):
+    # The APIError gspread raises for a Google answer with the given HTTP status
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({"error": {"code": status, "message": "test error", "status": "TEST"}}).encode()
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return gspread.exceptions.APIError(response)
+
+
+class FakeSheet:
+    # The only worksheet attribute the allocator reads
+    def __init__(self, title="Report 2026-10"):
+        self.title = title
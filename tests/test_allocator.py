@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+from allocator import ColumnAllocator
+from conftest import FakeSheet
+
+
+@pytest.fixture
+def allocator(tmp_path):
+    allocator = ColumnAllocator(str(tmp_path / "columns.sqlite3"), retention=60)
+    yield allocator
+    allocator.close()
+
+
+def next_column(column):
+    # The next_column callback of a sheet whose next empty column is `column`
+    async def read():
+        return column
+    return read
+
+
+def test_reports_get_distinct_columns(allocator):
+    sheet = FakeSheet()
+
+    async def allocate_all():
+        return await asyncio.gather(*(
+            allocator.allocate(sheet, "rem1", f"entry-{index}", next_column(3)) for index in range(5)
+        ))
+
+    assert sorted(asyncio.run(allocate_all())) == [3, 4, 5, 6, 7]
+
+
+def test_allocation_is_idempotent_per_entry(allocator):
+    sheet = FakeSheet()
+
+    async def allocate_twice():
+        first = await allocator.allocate(sheet, "rem1", "entry", next_column(3))
+        second = await allocator.allocate(sheet, "rem1", "entry", next_column(10))
+        return first, second
+
+    assert asyncio.run(allocate_twice()) == (3, 3)
+
+
+def test_sheet_ahead_of_the_reservations_wins(allocator):
+    sheet = FakeSheet()
+
+    async def allocate():
+        await allocator.allocate(sheet, "rem1", "first", next_column(3))
+        return await allocator.allocate(sheet, "rem1", "second", next_column(9))
+
+    assert asyncio.run(allocate()) == 9
+
+
+def test_departments_and_worksheets_are_independent(allocator):
+    async def allocate():
+        return [
+            await allocator.allocate(FakeSheet("May"), "rem1", "a", next_column(3)),
+            await allocator.allocate(FakeSheet("May"), "wash", "b", next_column(3)),
+            await allocator.allocate(FakeSheet("June"), "rem1", "c", next_column(3)),
+        ]
+
+    assert asyncio.run(allocate()) == [3, 3, 3]
+
+
+def test_claimed_column_is_not_handed_out(allocator):
+    sheet = FakeSheet()
+
+    async def allocate():
+        await allocator.claim(sheet, "rem1", "restored", 5)
+        return await allocator.allocate(sheet, "rem1", "new", next_column(3))
+
+    assert asyncio.run(allocate()) == 6
+
+
+def test_claim_of_a_reserved_column_is_ignored(allocator):
+    sheet = FakeSheet()
+
+    async def claim():
+        await allocator.allocate(sheet, "rem1", "first", next_column(3))
+        await allocator.claim(sheet, "rem1", "second", 3)
+        return await allocator.run(lambda conn: conn.execute(
+            "SELECT entry_id FROM reservations WHERE column_index = 3"
+        ).fetchall())
+
+    assert [row[0] for row in asyncio.run(claim())] == ["first"]
+
+
+def test_released_reservations_are_purged_after_retention(allocator):
+    sheet = FakeSheet()
+
+    async def purge():
+        await allocator.allocate(sheet, "rem1", "written", next_column(3))
+        await allocator.allocate(sheet, "rem1", "pending", next_column(3))
+        await allocator.release("written")
+        fresh = await allocator.purge()
+        # Age the release past the retention
+        await allocator.run(lambda conn: conn.execute(
+            "UPDATE reservations SET released_at = ?", (time.time() - 120,)
+        ))
+        await allocator.run(lambda conn: conn.execute(
+            "UPDATE reservations SET released_at = NULL WHERE entry_id = 'pending'"
+        ))
+        return fresh, await allocator.purge()
+
+    assert asyncio.run(purge()) == (0, 1)
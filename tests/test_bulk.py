@@ -0,0 +1,81 @@
+from datetime import date
+
+import bulk
+from departments import DEPARTMENTS
+
+TODAY = date(2026, 10, 16)
+BREAKUP = DEPARTMENTS["breakup"]
+
+
+def test_message_of_field_value_lines():
+    parsed, errors = bulk.parse_message(BREAKUP, "plan=4\nserviced=3\nload_percentage=87,5\nnew_clients=1\nnotes=-")
+
+    assert errors == []
+    assert parsed == {"plan": 4, "serviced": 3, "load_percentage": 87.5, "new_clients": 1, "notes": "-"}
+
+
+def test_message_of_one_answer_per_line():
+    parsed, errors = bulk.parse_message(BREAKUP, "4\n3\n87.5\n1\nall good")
+
+    assert errors == []
+    assert parsed["notes"] == "all good"
+
+
+def test_message_lists_every_problem():
+    parsed, errors = bulk.parse_message(BREAKUP, "plan=x\nplan=4\nbogus=1\nserviced=3")
+
+    assert "plan: given more than once" in errors
+    assert any(error.startswith("'bogus=1'") for error in errors)
+    assert any(error.startswith("plan: 'x' is not valid") for error in errors)
+    assert "load_percentage: missing" in errors
+
+
+def test_message_with_the_wrong_number_of_lines():
+    parsed, errors = bulk.parse_message(BREAKUP, "4\n3")
+
+    assert parsed == {}
+    assert errors == ["Expected 5 lines, one per question, or field=value lines, got 2 lines"]
+
+
+def test_csv_rows():
+    content = ("department;password;date;plan;serviced;load_percentage;new_clients;notes\n"
+               "breakup;5;15/10/2026;4;3;87.5;1;-\n"
+               "\n"
+               "breakup;5;2026-10-16;4;3;87.5;1;-\n").encode()
+
+    rows = list(bulk.read_rows(content, "reports.csv"))
+
+    assert [number for number, row in rows] == [2, 4]
+    assert rows[0][1]["department"] == "breakup"
+
+
+def test_rows_are_validated_one_report_each():
+    rows = [
+        (2, {"department": "breakup", "password": "5", "date": "15/10/2026", "plan": "4", "serviced": "3",
+             "load_percentage": "87.5", "new_clients": "1", "notes": "-"}),
+        (3, {"department": "breakup", "password": "wrong"}),
+        (4, {"department": "nope"}),
+        (5, {"department": "breakup", "password": "5", "date": "17/10/2026"}),
+        (6, {"department": "breakup", "password": "5", "date": "15/10/2026", "plan": "4", "serviced": "3",
+             "load_percentage": "87.5", "new_clients": "1", "notes": "-"}),
+    ]
+
+    result = bulk.parse_rows(rows, TODAY)
+
+    assert len(result.reports) == 1
+    assert result.reports[0]["plan"] == 4
+    assert result.errors == [
+        "Row 3: wrong password for breakup",
+        "Row 4: unknown department 'nope'",
+        "Row 5: 17/10/2026 is in the future",
+        "Row 6: a second breakup report for 15/10/2026",
+    ]
+
+
+def test_logged_in_user_needs_no_password():
+    rows = [(2, {"plan": "4", "serviced": "3", "load_percentage": "87.5", "new_clients": "1", "notes": "-"})]
+
+    result = bulk.parse_rows(rows, TODAY, department="breakup")
+
+    assert result.errors == []
+    assert result.reports[0]["department"] == "breakup"
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from ledger import SubmissionLedger
+
+DAY = date(2026, 10, 16)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SubmissionLedger(str(tmp_path / "ledger.sqlite3"), ("rem1", "wash"), retention_days=7)
+    yield ledger
+    ledger.close()
+
+
+def test_pending_report_blocks_a_second_one(ledger):
+    asyncio.run(ledger.load(DAY))
+    ledger.mark_pending(1, "rem1", DAY)
+
+    assert not ledger.can_send(1, "rem1", DAY)
+    assert ledger.can_send(1, "wash", DAY)
+    assert ledger.can_send(2, "rem1", DAY)
+    # A pending report does not count as a submission yet
+    assert ledger.missing_departments(DAY) == ["rem1", "wash"]
+
+
+def test_committed_report_moves_from_pending(ledger):
+    asyncio.run(ledger.load(DAY))
+    ledger.mark_pending(1, "rem1", DAY)
+    asyncio.run(ledger.record(1, "rem1", DAY))
+
+    assert not ledger.can_send(1, "rem1", DAY)
+    assert 1 not in ledger._pending["rem1"]
+    assert ledger.missing_departments(DAY) == ["wash"]
+
+
+def test_committed_reports_survive_a_restart(tmp_path):
+    path = str(tmp_path / "ledger.sqlite3")
+    first = SubmissionLedger(path, ("rem1", "wash"))
+    asyncio.run(first.record(1, "rem1", DAY))
+    first.close()
+
+    second = SubmissionLedger(path, ("rem1", "wash"))
+    asyncio.run(second.load(DAY))
+    assert not second.can_send(1, "rem1", DAY)
+    second.close()
+
+
+def test_rollover_starts_an_empty_day(ledger):
+    asyncio.run(ledger.load(DAY))
+    asyncio.run(ledger.record(1, "rem1", DAY))
+    ledger.mark_pending(2, "wash", DAY)
+
+    tomorrow = DAY + timedelta(days=1)
+    assert ledger.can_send(1, "rem1", tomorrow)
+    assert ledger.can_send(2, "wash", tomorrow)
+
+
+def test_load_trims_old_days(ledger):
+    asyncio.run(ledger.record(1, "rem1", DAY - timedelta(days=30)))
+    asyncio.run(ledger.load(DAY))
+
+    assert asyncio.run(ledger.run(lambda conn: conn.execute("SELECT COUNT(*) FROM submissions").fetchone()[0])) == 0
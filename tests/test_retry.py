@@ -0,0 +1,159 @@
+import asyncio
+
+import google.auth.exceptions
+import pytest
+import requests
+
+import retry
+from conftest import api_error
+
+
+def make_policy(failure_threshold=3, max_attempts=3):
+    # No delay between attempts, the breaker's timing is moved by hand
+    breaker = retry.CircuitBreaker("Test", failure_threshold=failure_threshold, reset_timeout=30)
+    return retry.RetryPolicy(breaker, max_attempts=max_attempts, base_delay=0, max_delay=0)
+
+
+def expire(breaker):
+    # Pretend reset_timeout has passed since the breaker opened
+    breaker.opened_at -= breaker.reset_timeout
+
+
+class Flaky:
+    # Async callable raising the given errors in turn, then returning "ok"
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_retries_transient_errors():
+    policy = make_policy()
+    func = Flaky(api_error(429), api_error(503))
+
+    assert asyncio.run(policy.call(func)) == "ok"
+    assert func.calls == 3
+    assert policy.retries == 2
+    assert policy.breaker.state == retry.CircuitBreaker.CLOSED
+
+
+def test_permanent_error_is_not_retried_and_counts_as_healthy():
+    policy = make_policy()
+    policy.breaker.failures = 2
+    func = Flaky(api_error(400))
+
+    with pytest.raises(retry.gspread.exceptions.APIError):
+        asyncio.run(policy.call(func))
+    assert func.calls == 1
+    assert policy.breaker.failures == 0
+
+
+def test_gives_up_after_max_attempts():
+    policy = make_policy(failure_threshold=10, max_attempts=2)
+    func = Flaky(api_error(500), api_error(500), api_error(500))
+
+    with pytest.raises(retry.gspread.exceptions.APIError):
+        asyncio.run(policy.call(func))
+    assert func.calls == 2
+    assert policy.failures == 1
+
+
+def test_breaker_opens_after_threshold_and_refuses_calls():
+    policy = make_policy(failure_threshold=2, max_attempts=5)
+    func = Flaky(api_error(429), api_error(429))
+
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.call(func))
+    assert policy.breaker.state == retry.CircuitBreaker.OPEN
+
+    func = Flaky()
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.call(func))
+    assert func.calls == 0
+
+
+def test_successful_probe_closes_the_breaker():
+    policy = make_policy(failure_threshold=1)
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.call(Flaky(api_error(503))))
+    expire(policy.breaker)
+
+    assert asyncio.run(policy.call(Flaky())) == "ok"
+    assert policy.breaker.state == retry.CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    policy = make_policy(failure_threshold=1)
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.call(Flaky(api_error(503))))
+    expire(policy.breaker)
+
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.call(Flaky(api_error(503))))
+    assert policy.breaker.state == retry.CircuitBreaker.OPEN
+    assert policy.breaker.retry_in() > 0
+
+
+def test_only_one_probe_at_a_time():
+    breaker = retry.CircuitBreaker("Test", failure_threshold=1)
+    breaker.record_failure()
+    expire(breaker)
+
+    assert breaker.before_call() is True
+    assert breaker.retry_in() == breaker.PROBE_WAIT
+    with pytest.raises(retry.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    policy = make_policy(failure_threshold=1)
+    policy.breaker.record_failure()
+    expire(policy.breaker)
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(policy.call(cancelled))
+    assert policy.breaker.state == retry.CircuitBreaker.HALF_OPEN
+
+    assert asyncio.run(policy.call(Flaky())) == "ok"
+    assert policy.breaker.state == retry.CircuitBreaker.CLOSED
+
+
+def test_lookup_neither_probes_nor_closes_the_breaker():
+    policy = make_policy(failure_threshold=1)
+    policy.breaker.record_failure()
+    with pytest.raises(retry.CircuitOpenError):
+        asyncio.run(policy.lookup(Flaky()))
+
+    expire(policy.breaker)
+    assert asyncio.run(policy.lookup(Flaky())) == "ok"
+    assert policy.breaker.state == retry.CircuitBreaker.OPEN
+    # The probe is still free for a real request
+    assert policy.breaker.before_call() is True
+
+
+def test_retry_after_is_the_minimum_delay():
+    policy = retry.RetryPolicy(retry.CircuitBreaker("Test"), base_delay=0.1, max_delay=60)
+
+    assert policy.next_delay(0.1, api_error(429, retry_after=7)) >= 7
+    assert policy.next_delay(0.1, api_error(429, retry_after=600)) == 60
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (api_error(429), True),
+    (api_error(503), True),
+    (api_error(404), False),
+    (requests.exceptions.ConnectionError(), True),
+    (google.auth.exceptions.TransportError("unreachable"), True),
+    (google.auth.exceptions.RefreshError("invalid_grant"), False),
+    (ValueError(), False),
+])
+def test_is_retryable(error, retryable):
+    assert retry.is_retryable(error) is retryable
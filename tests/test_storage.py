@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"), ttl=60)
+    yield storage
+    asyncio.run(storage.close())
+
+
+def age(storage, seconds):
+    # Move the last update of every session back in time
+    asyncio.run(storage.db.run(lambda conn: conn.execute("UPDATE fsm SET updated_at = updated_at - ?", (seconds,))))
+
+
+def test_update_data_merges_fields(storage):
+    async def update():
+        await storage.set_data(chat=1, user=1, data={"department": "rem1", "step": 0})
+        await storage.update_data(chat=1, user=1, data={"step": 1, "plan": 4})
+        return await storage.get_data(chat=1, user=1)
+
+    assert asyncio.run(update()) == {"department": "rem1", "step": 1, "plan": 4}
+
+
+def test_expired_session_reads_as_empty(storage):
+    asyncio.run(storage.set_state(chat=1, user=1, state="ReportForm:answering"))
+    asyncio.run(storage.set_data(chat=1, user=1, data={"step": 3}))
+    age(storage, 120)
+
+    assert asyncio.run(storage.get_state(chat=1, user=1)) is None
+    assert asyncio.run(storage.get_data(chat=1, user=1)) == {}
+
+
+def test_write_to_an_expired_session_starts_a_new_one(storage):
+    asyncio.run(storage.set_state(chat=1, user=1, state="ReportForm:answering"))
+    asyncio.run(storage.set_data(chat=1, user=1, data={"step": 3, "plan": 4}))
+    age(storage, 120)
+    asyncio.run(storage.update_data(chat=1, user=1, data={"department": "wash"}))
+
+    assert asyncio.run(storage.get_data(chat=1, user=1)) == {"department": "wash"}
+    assert asyncio.run(storage.get_state(chat=1, user=1)) is None
+
+
+def test_purge_removes_only_expired_sessions(storage):
+    asyncio.run(storage.set_state(chat=1, user=1, state="ReportForm:answering"))
+    age(storage, 120)
+    asyncio.run(storage.set_state(chat=2, user=2, state="ReportForm:answering"))
+
+    assert asyncio.run(storage.purge_expired()) == [(1, 1, "ReportForm:answering")]
+    # Every removed session is returned once
+    assert asyncio.run(storage.purge_expired()) == []
+    assert asyncio.run(storage.count_active()) == 1
+
+
+def test_sessions_never_expire_without_ttl(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+    asyncio.run(storage.set_state(chat=1, user=1, state="ReportForm:answering"))
+    asyncio.run(storage.db.run(lambda conn: conn.execute("UPDATE fsm SET updated_at = ?", (time.time() - 10 ** 6,))))
+
+    assert asyncio.run(storage.purge_expired()) == []
+    assert asyncio.run(storage.get_state(chat=1, user=1)) == "ReportForm:answering"
+    asyncio.run(storage.close())
@@ -0,0 +1,40 @@
+from datetime import date
+
+import sheets
+import transfer
+from departments import DEPARTMENTS
+
+BREAKUP = DEPARTMENTS["breakup"]
+
+
+def written_values(record):
+    # Cell values of the report's updates, by range
+    updates = sheets.report_updates(BREAKUP.questions, BREAKUP.start_row, 3, date(2026, 10, 16),
+                                    transfer.record_answers(BREAKUP, record))
+    return {update["range"]: update["values"][0][0] for update in updates}
+
+
+def test_csv_numbers_are_written_as_numbers():
+    values = written_values({"day": "2026-10-16", "plan": "4", "serviced": "3", "load_percentage": "87,5",
+                             "new_clients": "1", "notes": "12"})
+
+    assert values["D56"] == 4
+    assert values["C57"] == 3
+    assert values["C58"] == 87.5
+    # Free text stays text, even when it looks like a number
+    assert values["C60"] == "'12"
+    assert values["C55"] == "16/10/2026"
+
+
+def test_whole_floats_of_int_questions_become_ints():
+    answers = transfer.record_answers(BREAKUP, {"day": "2026-10-16", "plan": 4.0, "load_percentage": 87.0})
+
+    assert answers["plan"] == 4 and isinstance(answers["plan"], int)
+    assert isinstance(answers["load_percentage"], float)
+    assert answers["notes"] is None
+
+
+def test_invalid_number_is_kept_as_text():
+    values = written_values({"day": "2026-10-16", "plan": "four"})
+
+    assert values["D56"] == "'four"
@@ -0,0 +1,425 @@
+"""
+    Bulk export of the report worksheets to local files and bulk import back into them.
+
+    Export reads the sheet in chunks of columns, one `batch_get` per chunk covering every
+    department block, and turns each report column into a flat record. Import writes
+    records back with one `values_batch_update` per batch. Only one chunk or batch is held
+    in memory at a time, whatever the size of the sheet or the file.
+
+    Records have the columns `worksheet`, `department`, `day`, `column` and one column per
+    question field. The file format follows the extension: .csv, .sqlite3/.sqlite/.db or
+    .parquet (needs the optional `pyarrow` package).
+
+    Usage (from the repository root, configured by the same .env as the bot):
+        python transfer.py export reports.csv
+        python transfer.py export reports.sqlite3 --worksheet "Report 2024-05"
+        python transfer.py import reports.csv --batch-size 500
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import logging
+import os
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+from gspread import utils
+
+import retry
+import sheets
+from allocator import ColumnAllocator
+from departments import DEPARTMENT_START_ROWS, DEPARTMENTS, parse_int, parse_text
+
+logger = logging.getLogger(__name__)
+
+# Every question field of any department, with whether it holds free text
+FIELD_IS_TEXT = {
+    question.field: question.parse is parse_text
+    for department in DEPARTMENTS.values()
+    for question in department.questions
+}
+
+RECORD_FIELDS = ("worksheet", "department", "day", "column") + tuple(FIELD_IS_TEXT)
+
+# Answers sit at most this many columns right of their report's date column
+MAX_SHIFT = max(question.shift for department in DEPARTMENTS.values() for question in department.questions)
+
+
+def chunked(iterable, size):
+    # Lists of up to `size` items, consuming the iterable lazily
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# The value of a cell in a fetched range, "" when the range stops before it
+def _cell(rows, row, col):
+    if row < len(rows) and col < len(rows[row]):
+        return rows[row][col]
+    return ""
+
+
+def parse_column(worksheet_title, department, rows, offset, col_index):
+    """
+        Turns one report column of a department block into a record.
+
+        Args:
+            worksheet_title (str): Title of the worksheet the block was read from.
+            department (departments.Department): The department of the block.
+            rows (list): The fetched block, starting at the department's start row.
+            offset (int): Position of the report's date column in the fetched block.
+            col_index (int): The report's date column in the sheet.
+
+        Returns:
+            dict: The record, None if the date cell does not hold a report date.
+    """
+    raw_date = _cell(rows, 0, offset)
+    try:
+        day = datetime.strptime(raw_date, sheets.SheetLayout.DATE_FORMAT).date()
+    except ValueError:
+        logger.warning(f"{worksheet_title}!{sheets.column_letter(col_index)}{department.start_row} "
+                       f"holds {raw_date!r} instead of a report date, skipping the column")
+        return None
+
+    record = {"worksheet": worksheet_title, "department": department.key, "day": day.isoformat(), "column": col_index}
+    for question in department.questions:
+        text = _cell(rows, question.row, offset + question.shift)
+        if not text:
+            record[question.field] = None
+            continue
+        try:
+            # Text written before answers were capped is exported as it is
+            record[question.field] = text if FIELD_IS_TEXT[question.field] else question.parse(text)
+        except ValueError:
+            logger.warning(f"{worksheet_title}!{sheets.column_letter(col_index + question.shift)}"
+                           f"{department.start_row + question.row} holds {text!r}, not a valid {question.field}")
+            record[question.field] = None
+    return record
+
+
+def block_ranges(first_column, last_column):
+    # The part of every department block between two columns, in the order of DEPARTMENTS
+    return [
+        f"{sheets.column_letter(first_column)}{department.start_row}:"
+        f"{sheets.column_letter(last_column)}{sheets.SheetLayout.last_row(department)}"
+        for department in DEPARTMENTS.values()
+    ]
+
+
+async def export_worksheet(sheet, writer, policy, chunk_columns=200):
+    """
+        Reads a worksheet chunk by chunk and yields the records of every chunk.
+
+        Each chunk is one `batch_get` over `chunk_columns` report columns (plus the columns
+        their shifted answers reach into) of every department block. The export stops at
+        the first chunk without any report date.
+
+        Args:
+            sheet (gspread.models.Sheet): The worksheet to read.
+            writer (sheets.SheetWriter): Writer used to run the requests off the event loop.
+            policy (retry.RetryPolicy): Retry policy of the requests.
+            chunk_columns (int): Number of report columns read per request.
+
+        Yields:
+            list: The records of one chunk, in column order.
+    """
+    for first_column in range(sheets.FIRST_DATA_COLUMN, sheet.col_count + 1, chunk_columns):
+        last_column = min(first_column + chunk_columns - 1, sheet.col_count)
+        value_ranges = await policy.call(
+            writer.run, sheet.batch_get, block_ranges(first_column, min(last_column + MAX_SHIFT, sheet.col_count))
+        )
+
+        records = []
+        found = False
+        for department, rows in zip(DEPARTMENTS.values(), value_ranges):
+            for offset in range(last_column - first_column + 1):
+                if not _cell(rows, 0, offset):
+                    continue
+                found = True
+                record = parse_column(sheet.title, department, rows, offset, first_column + offset)
+                if record is not None:
+                    records.append(record)
+        if not found:
+            return
+
+        records.sort(key=lambda record: record["column"])
+        yield records
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, RECORD_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, records):
+        self.writer.writerows(records)
+
+    def close(self):
+        self.file.close()
+
+
+class SQLiteSink:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        columns = ", ".join(f"{field} {'TEXT' if FIELD_IS_TEXT[field] else 'REAL'}" for field in FIELD_IS_TEXT)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS reports (worksheet TEXT, department TEXT NOT NULL, "
+                          f"day TEXT NOT NULL, column INTEGER, {columns})")
+        self.insert = (f"INSERT INTO reports ({', '.join(RECORD_FIELDS)}) "
+                       f"VALUES ({', '.join('?' * len(RECORD_FIELDS))})")
+
+    def write(self, records):
+        with self.conn:
+            self.conn.executemany(self.insert, ([record.get(field) for field in RECORD_FIELDS] for record in records))
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetSink:
+    def __init__(self, path):
+        # pyarrow is only needed for Parquet files
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema(
+            [("worksheet", pyarrow.string()), ("department", pyarrow.string()), ("day", pyarrow.string()),
+             ("column", pyarrow.int64())]
+            + [(field, pyarrow.string() if is_text else pyarrow.float64()) for field, is_text in FIELD_IS_TEXT.items()]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, records):
+        # One row group per chunk
+        self.writer.write_table(self.pyarrow.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".sqlite3", ".sqlite", ".db"):
+        return "sqlite"
+    if extension == ".parquet":
+        return "parquet"
+    raise ValueError(f"Unsupported file type {extension!r}, use .csv, .sqlite3 or .parquet")
+
+
+def open_sink(path):
+    return {"csv": CsvSink, "sqlite": SQLiteSink, "parquet": ParquetSink}[_format(path)](path)
+
+
+def read_records(path):
+    """
+        Streams the records of an exported file.
+
+        Yields:
+            dict: One record, empty cells as None.
+    """
+    file_format = _format(path)
+    if file_format == "csv":
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                yield {field: value if value != "" else None for field, value in row.items()}
+    elif file_format == "sqlite":
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute("SELECT * FROM reports ORDER BY day, column"):
+                yield dict(row)
+        finally:
+            conn.close()
+    else:
+        import pyarrow.parquet
+
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+
+
+def record_answers(department, record):
+    """
+        Converts the answers of an imported record to the values the bot writes for them.
+
+        A .csv file gives every answer as text and .sqlite3/.parquet files give numbers as
+        floats. Numeric answers are parsed with their question's validator so that they
+        reach the sheet as numbers; only free-text answers are written as text.
+
+        Args:
+            department (departments.Department): The department of the record.
+            record (dict): The imported record.
+
+        Returns:
+            dict: The answers by field, empty ones as None.
+    """
+    answers = {}
+    for question in department.questions:
+        value = record.get(question.field)
+        if isinstance(value, str) and not FIELD_IS_TEXT[question.field]:
+            try:
+                value = question.parse(value)
+            except ValueError:
+                logger.warning(f"{department.key} record of {record['day']} holds {value!r}, "
+                               f"not a valid {question.field}, importing it as text")
+        elif isinstance(value, float) and question.parse is parse_int and value.is_integer():
+            value = int(value)
+        answers[question.field] = value
+    return answers
+
+
+async def import_records(client, records, writer, policy, allocator, batch_size=500, keep_columns=False):
+    """
+        Writes records into the report worksheets, one `values_batch_update` per batch.
+
+        Every record goes to the worksheet of its day, like a report sent through the bot.
+        By default it is appended at the department's next empty column; with `keep_columns`
+        it is written back to the column it was exported from. Either way its column is
+        reserved in the bot's column allocator until the batch is written, so a running bot
+        never writes a report into it.
+
+        Args:
+            client (sheets.SheetClient): The client of the spreadsheet.
+            records (iterable): The records to write, oldest first.
+            writer (sheets.SheetWriter): Writer used to run the requests off the event loop.
+            policy (retry.RetryPolicy): Retry policy of the requests.
+            allocator (allocator.ColumnAllocator): The column allocator shared with the bot.
+            batch_size (int): Number of records written per request.
+            keep_columns (bool): Write every record to its exported `column`.
+
+        Returns:
+            int: The number of records written.
+    """
+    # Cursors are read once, columns the bot takes meanwhile are known to the allocator
+    cursors = sheets.ColumnCursorIndex(DEPARTMENT_START_ROWS, max_age=float("inf"))
+    loaded = set()
+    written = 0
+    run = uuid.uuid4().hex
+
+    for batch_number, batch in enumerate(chunked(records, batch_size)):
+        data = []
+        spreadsheet = None
+        entry_ids = []
+        try:
+            for index, record in enumerate(batch):
+                department = DEPARTMENTS.get(record["department"])
+                if department is None:
+                    logger.warning(f"Skipping a record of unknown department {record['department']!r}")
+                    continue
+
+                day = date.fromisoformat(record["day"])
+                sheet = await policy.lookup(writer.run, client.worksheet, day)
+                spreadsheet = sheet.spreadsheet
+                # Reservations are keyed like outbox entries, one per imported record
+                entry_id = f"import-{run}-{batch_number}-{index}"
+                if keep_columns and record.get("column"):
+                    col_index = int(record["column"])
+                    await allocator.claim(sheet, department.key, entry_id, col_index)
+                else:
+                    if sheet.title not in loaded:
+                        await policy.call(writer.run, cursors.load, sheet)
+                        loaded.add(sheet.title)
+                    col_index = await allocator.allocate(
+                        sheet, department.key, entry_id,
+                        lambda: policy.lookup(writer.run, cursors.next_column, sheet, department.key)
+                    )
+                entry_ids.append(entry_id)
+                cursors.advance(sheet, department.key, col_index)
+                await policy.lookup(writer.run, client.ensure_columns, sheet,
+                                    col_index + max(question.shift for question in department.questions))
+
+                data.extend({
+                    'range': utils.absolute_range_name(sheet.title, update['range']),
+                    'values': update['values']
+                } for update in sheets.report_updates(department.questions, department.start_row, col_index, day,
+                                                      record_answers(department, record)))
+
+            if data:
+                await policy.call(writer.run, spreadsheet.values_batch_update,
+                                  {"valueInputOption": "USER_ENTERED", "data": data})
+        finally:
+            # The columns are in the sheet now, or never will be if the write failed
+            for entry_id in entry_ids:
+                await allocator.release(entry_id)
+        written += len(entry_ids)
+        logger.info(f"Imported {written} record(s)")
+    return written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export the report worksheets to a file or import a file into them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="read the sheet into a .csv, .sqlite3 or .parquet file")
+    export_parser.add_argument("path", help="file to write")
+    export_parser.add_argument("--worksheet", action="append",
+                               help="worksheet to export, may be repeated (default: every worksheet but the template)")
+    export_parser.add_argument("--chunk-columns", type=int, default=200, help="report columns read per request")
+
+    import_parser = subparsers.add_parser("import", help="write the records of a file into the sheet")
+    import_parser.add_argument("path", help="file to read")
+    import_parser.add_argument("--batch-size", type=int, default=500, help="records written per request")
+    import_parser.add_argument("--keep-columns", action="store_true",
+                               help="write records to their exported column instead of appending them")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    load_dotenv()
+
+    # The same spreadsheet and shards as the bot, see create_sheets_pipeline in main.py
+    client = sheets.SheetClient(
+        os.getenv("CREDS"),
+        ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"],
+        spreadsheet_key=os.getenv("SPREADSHEET_KEY"),
+        spreadsheet_title="Report",
+        timeout=60,
+        shard_title=os.getenv("SHEET_SHARD_TITLE", "Report %Y-%m"),
+        template_title=os.getenv("SHEET_TEMPLATE", "Template")
+    )
+    writer = sheets.SheetWriter(ThreadPoolExecutor(max_workers=1), max_in_flight=1)
+    policy = retry.RetryPolicy(retry.CircuitBreaker("Google Sheets"), max_attempts=8)
+
+    if args.command == "import":
+        # The bot's allocator file, see ALLOCATOR_PATH in main.py
+        allocator = ColumnAllocator(os.getenv("ALLOCATOR_PATH", "columns.sqlite3"))
+        try:
+            written = await import_records(client, read_records(args.path), writer, policy, allocator,
+                                           batch_size=args.batch_size, keep_columns=args.keep_columns)
+        finally:
+            allocator.close()
+        print(f"Imported {written} record(s) from {args.path}")
+        return
+
+    spreadsheet = await policy.call(writer.run, client.spreadsheet)
+    if args.worksheet:
+        worksheets = [await policy.call(writer.run, spreadsheet.worksheet, title) for title in args.worksheet]
+    else:
+        worksheets = [sheet for sheet in await policy.call(writer.run, spreadsheet.worksheets)
+                      if sheet.title != client.template_title]
+
+    sink = open_sink(args.path)
+    exported = 0
+    try:
+        for sheet in worksheets:
+            async for records in export_worksheet(sheet, writer, policy, chunk_columns=args.chunk_columns):
+                sink.write(records)
+                exported += len(records)
+            logger.info(f"Exported {sheet.title!r}, {exported} record(s) so far")
+    finally:
+        sink.close()
+    print(f"Exported {exported} record(s) to {args.path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,129 @@
+import asyncio
+from collections import Counter
+
+from aiogram import types
+from aiogram.dispatcher.filters.builtin import StateFilter
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import bulk
+from departments import TEXT_ERROR
+
+STALE_BUTTON = "This button is no longer active."
+
+
+class ValidationMiddleware(BaseMiddleware):
+    """
+        Rejects invalid updates before any handler runs, so spam and double taps cost no
+        storage writes or extra replies.
+
+        The user's state is read once per update and shared with the handlers' state filters.
+        The presses of one user are handled one at a time, so a double tap sees the state
+        its first tap set. A button press whose data is not one of the buttons of that state
+        (a stale keyboard, a double tap, forged data) is answered with a short notice and
+        dropped. A message in
+        a state that expects text must be text; in `answering_state` the answer is checked
+        with the current question's validator and an invalid one gets the question's error
+        message. The session data read for that check is passed to the handler as `session`.
+
+        Args:
+            callbacks (dict): Mapping of state name to the callback data accepted in it.
+            text_states (iterable): States whose messages must be text.
+            departments (dict): Mapping of department key to its Department entry.
+            answering_state (str): The state in which the report questions are answered.
+    """
+
+    def __init__(self, callbacks, text_states, departments, answering_state):
+        super().__init__()
+        self.callbacks = {state: frozenset(data) for state, data in callbacks.items()}
+        self.known_callbacks = frozenset().union(*self.callbacks.values())
+        self.text_states = frozenset(text_states)
+        self.answering_state = answering_state
+        # Validator and error message of every step of every department, looked up by position
+        self.validators = {
+            key: tuple((question.parse, question.error) for question in department.questions)
+            for key, department in departments.items()
+        }
+        self.rejected = Counter()
+        # Lock and number of presses holding or waiting for it, by user
+        self._pressing = {}
+
+    async def _state(self, chat, user):
+        # Read the state once and hand it to the state filters, which would otherwise read it again
+        state = await self.manager.dispatcher.storage.get_state(chat=chat, user=user)
+        StateFilter.ctx_state.set(state)
+        return state
+
+    async def _reject_callback(self, query, text=None):
+        self.rejected["callback_query"] += 1
+        await query.answer(text)
+        raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data):
+        if query.data not in self.known_callbacks:
+            await self._reject_callback(query)
+
+        # Presses of one batch run concurrently, a second tap must wait for the state the first one sets
+        user = query.from_user.id
+        await self._lock(user)
+        data["validation_user"] = user
+
+        chat = query.message.chat.id if query.message else None
+        try:
+            state = await self._state(chat, user)
+        except Exception:
+            self._unlock(user)
+            raise
+        if query.data not in self.callbacks.get(state, ()):
+            self._unlock(user)
+            await self._reject_callback(query, STALE_BUTTON)
+
+    async def on_post_process_callback_query(self, query: types.CallbackQuery, results, data):
+        if "validation_user" in data:
+            self._unlock(data["validation_user"])
+
+    async def _lock(self, user):
+        entry = self._pressing.setdefault(user, [asyncio.Lock(), 0])
+        entry[1] += 1
+        await entry[0].acquire()
+
+    def _unlock(self, user):
+        # Forget the lock once no press of the user holds or waits for it
+        entry = self._pressing[user]
+        entry[0].release()
+        entry[1] -= 1
+        if not entry[1]:
+            del self._pressing[user]
+
+    async def on_pre_process_message(self, message: types.Message, data):
+        # Commands and uploads are handled in every state
+        if message.is_command() or message.document:
+            return
+
+        state = await self._state(message.chat.id, message.from_user.id)
+        if state not in self.text_states:
+            return
+        if not message.text:
+            self.rejected["message"] += 1
+            await message.answer(TEXT_ERROR)
+            raise CancelHandler()
+        if state != self.answering_state:
+            return
+
+        session = await self.manager.dispatcher.storage.get_data(chat=message.chat.id, user=message.from_user.id)
+        validators = self.validators.get(session.get("department"))
+        step = session.get("step", 0)
+        if validators is None or step >= len(validators):
+            return
+        data["session"] = session
+
+        # A whole report in one message is validated by its handler
+        if step == 0 and bulk.is_bulk_text(message.text):
+            return
+        parse, error = validators[step]
+        try:
+            parse(message.text)
+        except ValueError:
+            self.rejected["message"] += 1
+            await message.answer(error)
+            raise CancelHandler()
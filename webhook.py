@@ -0,0 +1,154 @@
+import asyncio
+import hmac
+import logging
+import signal
+
+from aiohttp import web
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SECRET_TOKEN_KEY = "WEBHOOK_SECRET_TOKEN"
+TRACKER_KEY = "UPDATE_TRACKER"
+
+
+class UpdateTracker:
+    """
+        Counts the updates that are being processed so that shutdown can wait for them.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __aenter__(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    async def drain(self, timeout):
+        """
+            Stops accepting updates and waits for the ones in flight.
+
+            Returns:
+                bool: True if all updates finished within the timeout.
+        """
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class SecretTokenRequestHandler(WebhookRequestHandler):
+    """
+        Webhook handler that only accepts requests carrying the configured secret token
+        and refuses new updates while the instance is draining.
+    """
+
+    async def post(self):
+        secret_token = self.request.app[SECRET_TOKEN_KEY]
+        if not hmac.compare_digest(self.request.headers.get(SECRET_TOKEN_HEADER, ""), secret_token):
+            logger.warning(f"Rejected webhook request from {self.request.remote}: invalid secret token")
+            raise web.HTTPForbidden()
+
+        tracker = self.request.app[TRACKER_KEY]
+        if tracker.draining:
+            # Telegram retries the update, the load balancer sends it to another instance
+            raise web.HTTPServiceUnavailable()
+
+        async with tracker:
+            return await super().post()
+
+
+async def health(request):
+    # Health endpoint for the load balancer, reports 503 once the instance starts draining
+    tracker = request.app[TRACKER_KEY]
+    if tracker.draining:
+        return web.json_response({"status": "draining", "in_flight": tracker.in_flight}, status=503)
+    return web.json_response({"status": "ok", "in_flight": tracker.in_flight})
+
+
+def start_webhook(dispatcher, *, url, path, secret_token, host, port, health_path="/healthz", drain_timeout=30,
+                  drain_grace=5, on_startup=None, on_shutdown=None):
+    """
+        Runs the bot as an aiohttp webhook server instead of long polling.
+
+        Every instance registers the same webhook URL and secret token on startup, so several
+        instances can run behind a load balancer. The webhook is not deleted on shutdown;
+        updates queued by Telegram are delivered once an instance is reachable again.
+
+        On SIGTERM or SIGINT the instance starts draining while it keeps listening: the
+        health endpoint answers 503 and new updates are refused with 503 for `drain_grace`
+        seconds, so the load balancer takes the instance out, then the updates in flight
+        are awaited and only then the server is stopped.
+
+        Args:
+            dispatcher (Dispatcher): The Dispatcher instance.
+            url (str): Public URL Telegram sends updates to.
+            path (str): Local path of the webhook route.
+            secret_token (str): Token Telegram sends in the X-Telegram-Bot-Api-Secret-Token header.
+            host (str): Interface to listen on.
+            port (int): Port to listen on.
+            health_path (str): Path of the health endpoint.
+            drain_timeout (float): Seconds to wait for in-flight updates on shutdown.
+            drain_grace (float): Seconds the instance reports draining before it waits for the updates in flight.
+            on_startup (callable): Called with the dispatcher after the webhook is registered.
+            on_shutdown (callable): Called with the dispatcher after in-flight updates are drained.
+
+        Returns:
+            None
+    """
+    if not secret_token:
+        raise ValueError("WEBHOOK_SECRET must be set in webhook mode")
+
+    tracker = UpdateTracker()
+    app = web.Application()
+    app[SECRET_TOKEN_KEY] = secret_token
+    app[TRACKER_KEY] = tracker
+    app.router.add_get(health_path, health)
+
+    async def register_webhook(dp):
+        await dp.bot.set_webhook(url, secret_token=secret_token)
+        logger.info(f"Webhook set to {url}")
+
+    executor = Executor(dispatcher)
+    executor.on_startup(register_webhook, polling=False)
+    if on_startup is not None:
+        executor.on_startup(on_startup, polling=False)
+    if on_shutdown is not None:
+        executor.on_shutdown(on_shutdown, polling=False)
+
+    executor.set_webhook(webhook_path=path, request_handler=SecretTokenRequestHandler, web_app=app)
+
+    async def serve():
+        # aiohttp closes the socket before on_shutdown, so the draining happens before the runner is stopped
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        await web.TCPSite(runner, host, port, shutdown_timeout=drain_timeout).start()
+        logger.info(f"Listening on {host}:{port}")
+
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+        try:
+            await stopping.wait()
+            tracker.draining = True
+            logger.info(f"Draining, stopping in {drain_grace} seconds")
+            await asyncio.sleep(drain_grace)
+            if not await tracker.drain(drain_timeout):
+                logger.warning(f"{tracker.in_flight} update(s) still in flight after {drain_timeout} seconds")
+        finally:
+            await runner.cleanup()
+
+    executor.loop.run_until_complete(serve())